@@ -0,0 +1,108 @@
+import hashlib
+import re
+
+import numpy as np
+
+from flashcard_extractor import estimate_tokens
+
+
+class HashingEmbedder:
+    """
+    Local, model-free embeddings: hashed word and character trigram counts.
+    Fast on CPU and good enough to find the paragraphs a question is about.
+    Anything with embed_documents/embed_query (e.g. OllamaEmbeddings) can be
+    used instead.
+    """
+    def __init__(self, dim=1024):
+        self.dim = dim
+
+    def _features(self, text):
+        words = re.findall(r"\w+", text.lower())
+        for word in words:
+            yield word
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3]
+
+    def _embed(self, text):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) == 0 else -1.0
+        return vec
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def split_chunks(text, max_tokens=200):
+    """
+    Split an article into paragraph chunks of at most about max_tokens.
+    Short paragraphs are merged, long ones are split between sentences.
+    """
+    pieces = []
+    for para in re.split(r"\n\s*\n|\n(?==)", text):
+        para = para.strip()
+        if not para:
+            continue
+        if estimate_tokens(para) <= max_tokens:
+            pieces.append(para)
+        else:
+            pieces.extend(s for s in re.split(r"(?<=[.!?])\s+", para) if s.strip())
+
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and estimate_tokens(current + " " + piece) > max_tokens:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class ArticleIndex:
+    """
+    Paragraph chunks of an article with one normalised embedding per row of
+    a NumPy matrix, so a query is a single matrix-vector product (cosine
+    similarity). Built once per article.
+    """
+    def __init__(self, text, embedder=None, chunk_tokens=200):
+        self.text = text
+        self.embedder = embedder or HashingEmbedder()
+        self.chunks = split_chunks(text, chunk_tokens)
+        if self.chunks:
+            self.matrix = self._normalise(np.asarray(self.embedder.embed_documents(self.chunks), dtype=np.float32))
+        else:
+            self.matrix = np.zeros((0, 1), dtype=np.float32)
+
+    @staticmethod
+    def _normalise(m):
+        norms = np.linalg.norm(m, axis=-1, keepdims=True)
+        return m / np.where(norms == 0, 1, norms)
+
+    def search(self, query, k=3):
+        """
+        Indices and scores of the k chunks most similar to query, best first.
+        """
+        if not self.chunks:
+            return []
+        q = self._normalise(np.asarray(self.embedder.embed_query(query), dtype=np.float32))
+        scores = self.matrix @ q
+        k = min(k, len(self.chunks))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def context_for(self, query, k=3):
+        """
+        The k most relevant chunks joined in article order, ready for the prompt.
+        The first chunk (the article's introduction) is always included.
+        """
+        picked = {i for i, _ in self.search(query, k)}
+        if self.chunks:
+            picked.add(0)
+        return "\n\n[…]\n\n".join(self.chunks[i] for i in sorted(picked))
@@ -0,0 +1,490 @@
+"""
+Small benchmarks for the lesson pipeline.
+
+    python benchmark.py packing --article-file artikel.txt
+    python benchmark.py packing --title "Vikingatiden" --chunk-tokens 400
+    python benchmark.py prefilter --title "Vikingatiden"
+    python benchmark.py deck --cards 50000
+    python benchmark.py lessons --lessons 2000
+    python benchmark.py offline --runs 20 --json bench.json
+    python benchmark.py reviews --cards 100000 --learners 5
+
+"offline" needs no model and no network: it runs the app's hot paths
+against local stand-ins for Ollama (stub_ollama.py) and Wikipedia
+(stub_wiki.py) and reports throughput and p50/p95 latency per scenario.
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import pickle
+import random
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from langchain_ollama import ChatOllama
+
+from flashcard_extractor import FlashcardExtractor, VocabEntry, estimate_tokens
+from vocab_deck import VocabDeck
+
+
+class CountingLLM:
+    """
+    Wraps a chat model and counts calls and prompt tokens. Uses the token
+    counts reported by Ollama when available, otherwise estimate_tokens.
+    """
+    def __init__(self, llm):
+        self.llm = llm
+        self.calls = 0
+        self.prompt_tokens = 0
+
+    def _count(self, messages, response):
+        self.calls += 1
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.prompt_tokens += usage.get("input_tokens") or sum(estimate_tokens(m.content) for m in messages)
+        return response
+
+    def invoke(self, messages, **kwargs):
+        return self._count(messages, self.llm.invoke(messages, **kwargs))
+
+    async def ainvoke(self, messages, **kwargs):
+        return self._count(messages, await self.llm.ainvoke(messages, **kwargs))
+
+
+def bench_packing(llm, article, chunk_tokens=400, max_concurrency=1):
+    """
+    Run the extractor once per sentence and once with packed chunks over the
+    same article and compare LLM calls, prompt tokens, wall time and card yield.
+    """
+    rows = []
+    for label, chunks in (("per-sentence", None), (f"chunked ({chunk_tokens})", chunk_tokens)):
+        counter = CountingLLM(llm)
+        extr = FlashcardExtractor(counter, article, max_concurrency=max_concurrency, chunk_tokens=chunks)
+        start = time.perf_counter()
+        extr.extract_vocab_entries()
+        rows.append((label, counter.calls, counter.prompt_tokens, time.perf_counter() - start, len(extr.vocab_entries)))
+
+    print(f"{'mode':<20}{'LLM calls':>10}{'prompt tok':>12}{'wall s':>9}{'cards':>7}")
+    for label, calls, tokens, wall, cards in rows:
+        print(f"{label:<20}{calls:>10}{tokens:>12}{wall:>9.1f}{cards:>7}")
+    return rows
+
+
+def bench_prefilter(llm, article, max_concurrency=1):
+    """
+    Extract the same article with and without the sentence pre-filter and
+    compare LLM calls and card yield.
+    """
+    rows = []
+    for label, prefilter in (("no pre-filter", False), ("pre-filter", True)):
+        counter = CountingLLM(llm)
+        extr = FlashcardExtractor(counter, article, max_concurrency=max_concurrency, prefilter=prefilter)
+        start = time.perf_counter()
+        extr.extract_vocab_entries()
+        rows.append((label, counter.calls, time.perf_counter() - start, len(extr.vocab_entries),
+                     len({e.term.lower() for e in extr.vocab_entries})))
+
+    print(f"{'mode':<16}{'LLM calls':>10}{'wall s':>9}{'cards':>7}{'unique':>8}")
+    for label, calls, wall, cards, unique in rows:
+        print(f"{label:<16}{calls:>10}{wall:>9.1f}{cards:>7}{unique:>8}")
+    print(f"LLM calls saved: {rows[0][1] - rows[1][1]} ({1 - rows[1][1] / max(rows[0][1], 1):.0%})")
+    return rows
+
+
+def synthetic_cards(n, seed=0):
+    """
+    n cards that look like extracted ones (unique strings, a handful of parts of speech).
+    """
+    rng = random.Random(seed)
+    pos = ["substantiv", "verb", "adjektiv", "adverb", "preposition", "fras"]
+    return [
+        VocabEntry(
+            f"ord{i}",
+            # Fresh string objects, as they come out of json.loads
+            "".join(rng.choice(pos)),
+            f"förklaring av ord {i} med några fler ord",
+            f"En exempelmening där ord{i} används.",
+            f"anmärkning {i}" if i % 3 else "",
+        )
+        for i in range(n)
+    ]
+
+
+def _measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = build()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size, elapsed
+
+
+def bench_deck(n=50000):
+    """
+    Memory of a deck of n cards as today's list of VocabEntry objects vs a
+    VocabDeck, plus the size of and time for their serialized state (gr.State copies).
+    """
+    rows = []
+    for label, build in (("list[VocabEntry]", lambda: synthetic_cards(n)),
+                         ("VocabDeck", lambda: VocabDeck(synthetic_cards(n)))):
+        deck, size, _ = _measure(build)
+        start = time.perf_counter()
+        copy.deepcopy(deck)
+        copy_s = time.perf_counter() - start
+        rows.append((label, size, len(pickle.dumps(deck)), copy_s))
+        del deck
+
+    print(f"{n} cards")
+    print(f"{'structure':<18}{'memory MB':>11}{'pickle MB':>11}{'deepcopy s':>12}")
+    for label, size, pickled, copy_s in rows:
+        print(f"{label:<18}{size / 1e6:>11.2f}{pickled / 1e6:>11.2f}{copy_s:>12.3f}")
+    print(f"memory saved: {1 - rows[1][1] / rows[0][1]:.0%}")
+    return rows
+
+
+WORDS = ("runsten handelsväg skeppssättning hövding blot tingsplats silvermynt vikingatåg kustremsa "
+         "bosättning hantverkare smedja gravhög sjöfart järnålder plundring långskepp skald").split()
+
+
+def synthetic_article(paragraphs=40, seed=0):
+    """
+    HTML of a Wikipedia-like article: paragraphs of sentences with rare words
+    (so the pre-filter keeps them), and headings now and then.
+    """
+    rng = random.Random(seed)
+    html = []
+    for p in range(paragraphs):
+        if p % 8 == 0:
+            html.append(f"<h2>Avsnitt {p // 8 + 1}</h2>")
+        sentences = [
+            f"Under {rng.choice(WORDS)}ens tid fanns en {rng.choice(WORDS)} nära {rng.choice(WORDS)}en vid kusten."
+            for _ in range(5)
+        ]
+        html.append("<p>" + " ".join(sentences) + "</p>")
+    return "\n".join(html)
+
+
+def bench_lessons(lessons=1000, cards=150, samples=50, latency=0.05, concurrency=4):
+    """
+    Time opening a library of precomputed lessons and loading single lessons
+    from it, against building the same lesson live (fetch + extraction)
+    from the local Wikipedia and Ollama stand-ins.
+    """
+    from stub_wiki import StubWiki
+    from stub_ollama import StubOllama
+    from lessons import LessonLibrary
+
+    tmp = tempfile.mkdtemp()
+    html = synthetic_article()
+    content = re.sub(r"<[^>]+>", "", html)
+    deck = VocabDeck(synthetic_cards(cards))
+    titles = [f"Lektion {i}" for i in range(lessons)]
+
+    library = LessonLibrary(os.path.join(tmp, "lessons"))
+    start = time.perf_counter()
+    for title in titles:
+        library.save(title, content, html, deck)
+    build_s = time.perf_counter() - start
+    size = os.path.getsize(library.data_path)
+
+    start = time.perf_counter()
+    library = LessonLibrary(library.path)
+    len(library)  # reads the index
+    open_s = time.perf_counter() - start
+
+    loads = []
+    for title in random.Random(1).sample(titles, min(samples, lessons)):
+        start = time.perf_counter()
+        lesson = library.load(title)
+        lesson.content, lesson.html, len(lesson.vocab)
+        loads.append(time.perf_counter() - start)
+
+    # The same lesson built live, against local stand-ins for Wikipedia and Ollama
+    reply = json.dumps([{"term": "runsten", "part_of_speech": "substantiv", "definition": "sten med runor",
+                         "example": "", "extra_note": ""}])
+    wiki = StubWiki(pages={"Lektion": html}).start()
+    ollama = StubOllama(reply=reply, latency=latency).start()
+    os.environ.update(WIKI_API_URL=wiki.url, WIKI_CACHE=os.path.join(tmp, "wiki.sqlite"))
+    from wiki_utils import fetch_wiki_pages
+    from llm_pool import LLMPool, Endpoint
+    llm = LLMPool([Endpoint(ollama.url, concurrency)]).for_task("extract")
+    start = time.perf_counter()
+    page = fetch_wiki_pages(["Lektion"])["Lektion"]
+    FlashcardExtractor(llm, page["content"], max_concurrency=concurrency).extract_vocab_entries()
+    live_s = time.perf_counter() - start
+    wiki.stop()
+    ollama.stop()
+
+    print(f"{lessons} lessons of {len(content) // 1000} kB text and {cards} cards, "
+          f"{size / 1e6:.1f} MB on disk, built in {build_s:.1f} s")
+    print(f"open library:       {open_s * 1000:8.1f} ms")
+    print(f"load lesson  p50:   {statistics.median(loads) * 1000:8.2f} ms   "
+          f"max: {max(loads) * 1000:.2f} ms")
+    print(f"build live:         {live_s * 1000:8.1f} ms   (LLM latency {latency * 1000:.0f} ms, "
+          f"concurrency {concurrency}, {ollama.requests.get('/api/chat', 0)} requests)")
+    print(f"speed-up:           {live_s / statistics.median(loads):8.0f}x")
+    return open_s, loads, live_s
+
+
+def _per_op(op, count):
+    # Mean microseconds of op(i) over count calls
+    start = time.perf_counter()
+    for i in range(count):
+        op(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def bench_reviews(cards=100_000, learners=5, ops=100_000, reviews=2000, scans=200):
+    """
+    Scheduling at scale: a due-queue of cards cards with due times spread over
+    30 days, against scanning all due times for every question; then adding,
+    loading and reviewing learners' decks through ReviewScheduler (SQLite).
+    """
+    from review_scheduler import ReviewScheduler, DueQueue, DAY
+
+    rng = random.Random(1)
+    dues = {f"ord{i}": rng.random() * 30 * DAY for i in range(cards)}
+    queue = DueQueue(dues)
+    step = 30 * DAY / ops  # the clock runs through the 30 days during the ops
+
+    def queue_op(i):
+        now = i * step
+        if i % 3 == 0:
+            queue.due_count(now)
+        elif i % 3 == 1:
+            queue.peek(now)
+        else:
+            queue.schedule(f"ord{rng.randrange(cards)}", now + rng.random() * 30 * DAY)
+
+    def scan_op(i):
+        now = i * ops / scans * step
+        if i % 3 == 0:
+            sum(1 for due in dues.values() if due <= now)
+        elif i % 3 == 1:
+            min(((due, key) for key, due in dues.items() if due <= now), default=None)
+        else:
+            dues[f"ord{rng.randrange(cards)}"] = now + rng.random() * 30 * DAY
+
+    queue_us = _per_op(queue_op, ops)
+    scan_us = _per_op(scan_op, scans)
+
+    path = os.path.join(tempfile.mkdtemp(), "reviews.sqlite")
+    scheduler = ReviewScheduler(path)
+    deck = VocabDeck(synthetic_cards(cards))
+    start = time.perf_counter()
+    for learner in range(learners):
+        scheduler.add(deck, f"elev{learner}", now=0)
+    add_s = (time.perf_counter() - start) / learners
+
+    scheduler = ReviewScheduler(path)  # as after a restart: the queues are loaded from SQLite
+    start = time.perf_counter()
+    for learner in range(learners):
+        scheduler.due_count(f"elev{learner}", now=0)
+    load_s = (time.perf_counter() - start) / learners
+
+    def review(i):
+        learner, now = f"elev{i % learners}", i * 10.0
+        card = scheduler.next_card(learner, now)
+        scheduler.grade(card.term, rng.choice((1, 3, 4, 5)), learner, now)
+        scheduler.due_count(learner, now)
+
+    review_us = _per_op(review, reviews)
+
+    print(f"due-queue of {cards} cards, due times over 30 days")
+    print(f"{'':<32}{'µs/op':>10}")
+    print(f"{'heap (due count, next, schedule)':<32}{queue_us:>10.2f}")
+    print(f"{'scan of all due times':<32}{scan_us:>10.0f}")
+    print(f"speed-up: {scan_us / queue_us:.0f}x")
+    print(f"{learners} learners x {cards} cards in SQLite ({os.path.getsize(path) / 1e6:.0f} MB)")
+    print(f"add deck:        {add_s * 1000:8.0f} ms per learner")
+    print(f"load queue:      {load_s * 1000:8.0f} ms per learner (once per process)")
+    print(f"review a card:   {review_us / 1000:8.2f} ms (next card + grade + due count, with the SQLite write)")
+    return queue_us, scan_us, add_s, load_s, review_us
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _scenario(name, runs, unit, work):
+    """
+    Run work() runs times; work returns the number of items it processed.
+    Anything work() prints to stdout is discarded; the app's logging is left alone.
+    """
+    times, items = [], 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            items += work()
+        times.append(time.perf_counter() - start)
+    return {
+        "scenario": name,
+        "runs": runs,
+        "p50_ms": round(percentile(times, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(times, 0.95) * 1000, 2),
+        "throughput": round(items / sum(times), 2),
+        "unit": unit,
+    }
+
+
+def bench_offline(runs=20, latency=0.02, tokens_per_second=200, paragraphs=20, cards=10000, concurrency=4):
+    """
+    The app's hot paths at realistic sizes against the local stand-ins:
+    vocabulary extraction (per sentence and chunked), chat turns, feedback,
+    random_topics and rendering a page of a large deck. Deterministic apart
+    from timing, so it can run in CI.
+    """
+    from stub_wiki import StubWiki
+    from stub_ollama import StubOllama, canned_reply
+
+    tmp = tempfile.mkdtemp()
+    wiki = StubWiki(pages={"Vikingatiden": synthetic_article(paragraphs)}).start()
+    ollama = StubOllama(reply=canned_reply, latency=latency, tokens_per_second=tokens_per_second).start()
+    # Everything the app reads from the environment at import time points at the stand-ins or a temp dir
+    os.environ.update(
+        OLLAMA_HOSTS=f"{ollama.url}={concurrency}",
+        WIKI_API_URL=wiki.url,
+        WIKI_CACHE=os.path.join(tmp, "wiki.sqlite"),
+        EXTRACTION_CACHE=os.path.join(tmp, "extraction.sqlite"),
+        VOCAB_STORE=os.path.join(tmp, "vocab.sqlite"),
+        TOPIC_POOL=os.path.join(tmp, "topics.json"),
+        LESSON_LIBRARY=os.path.join(tmp, "lessons"),
+        REVIEW_DB=os.path.join(tmp, "reviews.sqlite"),
+    )
+    from langchain_core.messages import HumanMessage
+    import llm_utils
+    from gui import build_flashcard_html
+
+    def teacher():
+        t = llm_utils.AITeacher(cache=None, store=None, library=None, max_concurrency=concurrency)
+        with contextlib.redirect_stdout(io.StringIO()):
+            t.fetch_wiki_articles(["Vikingatiden"])
+        return t
+
+    article = teacher().article
+    extract_llm = llm_utils.pool.for_task("extract")
+
+    def extract(chunk_tokens=None):
+        extr = FlashcardExtractor(extract_llm, article, max_concurrency=concurrency, chunk_tokens=chunk_tokens)
+        extr.extract_vocab_entries()
+        return extr.stats["sentences"]
+
+    chat = teacher()
+
+    def turn():
+        chat.diskussion("Jag tycker att vikingarna var skickliga handelsmän.", chat.article)
+        return 1
+
+    def feedback():
+        t = teacher()
+        for i in range(5):
+            t.message_history.append(HumanMessage(content=f"Vikingarna reste långt, mening {i}."))
+        t.feedback()
+        return 5
+
+    deck = VocabDeck(synthetic_cards(cards))
+    pages = iter(range(cards))
+
+    def render():
+        build_flashcard_html(deck, next(pages) % (cards // 30))
+        return 1
+
+    results = [
+        _scenario("extract (per sentence)", max(1, runs // 10), "sentences/s", extract),
+        _scenario("extract (chunked 400)", max(1, runs // 10), "sentences/s", lambda: extract(400)),
+        _scenario("diskussion", runs, "turns/s", turn),
+        _scenario("feedback (5 messages)", max(1, runs // 4), "messages/s", feedback),
+        _scenario("random_topics", runs, "calls/s", lambda: len(llm_utils.random_topics()) and 1),
+        _scenario(f"build_flashcard_html ({cards} cards)", runs * 10, "pages/s", render),
+    ]
+    wiki.stop()
+    ollama.stop()
+
+    print(f"stub LLM: {latency * 1000:.0f} ms latency, {tokens_per_second} tokens/s, "
+          f"{concurrency} parallel; article: {len(article) // 1000} kB")
+    print(f"{'scenario':<36}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'throughput':>13}  unit")
+    for r in results:
+        print(f"{r['scenario']:<36}{r['runs']:>6}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['throughput']:>13.1f}  {r['unit']}")
+    return results
+
+
+def load_article(args):
+    if args.article_file:
+        with open(args.article_file, encoding="utf-8") as f:
+            return f.read()
+    from wiki_utils import fetch_wiki_article
+    return fetch_wiki_article(args.title)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    packing = sub.add_parser("packing", help="per-sentence vs chunked vocabulary extraction")
+    source = packing.add_mutually_exclusive_group(required=True)
+    source.add_argument("--article-file")
+    source.add_argument("--title", help="Swedish Wikipedia article to fetch")
+    packing.add_argument("--chunk-tokens", type=int, default=400)
+    packing.add_argument("--concurrency", type=int, default=1)
+    packing.add_argument("--model", default="gemma3:4b")
+
+    prefilter = sub.add_parser("prefilter", help="vocabulary extraction with and without sentence pre-filter")
+    source = prefilter.add_mutually_exclusive_group(required=True)
+    source.add_argument("--article-file")
+    source.add_argument("--title", help="Swedish Wikipedia article to fetch")
+    prefilter.add_argument("--concurrency", type=int, default=1)
+    prefilter.add_argument("--model", default="gemma3:4b")
+
+    deck = sub.add_parser("deck", help="memory of list[VocabEntry] vs VocabDeck")
+    deck.add_argument("--cards", type=int, default=50000)
+
+    lessons = sub.add_parser("lessons", help="loading precomputed lessons vs building them live")
+    lessons.add_argument("--lessons", type=int, default=1000)
+    lessons.add_argument("--cards", type=int, default=150)
+    lessons.add_argument("--latency", type=float, default=0.05, help="seconds per stub LLM reply")
+    lessons.add_argument("--concurrency", type=int, default=4)
+
+    reviews = sub.add_parser("reviews", help="spaced-repetition due-queue vs scanning, and review latency")
+    reviews.add_argument("--cards", type=int, default=100_000, help="cards per learner")
+    reviews.add_argument("--learners", type=int, default=5)
+    reviews.add_argument("--ops", type=int, default=100_000, help="due-queue operations to time")
+
+    offline = sub.add_parser("offline", help="hot paths against local Ollama/Wikipedia stand-ins")
+    offline.add_argument("--runs", type=int, default=20)
+    offline.add_argument("--latency", type=float, default=0.02, help="seconds before each stub reply")
+    offline.add_argument("--tokens-per-second", type=float, default=200)
+    offline.add_argument("--paragraphs", type=int, default=20, help="size of the article")
+    offline.add_argument("--cards", type=int, default=10000, help="size of the deck to render")
+    offline.add_argument("--concurrency", type=int, default=4)
+    offline.add_argument("--json", help="also write the results to this file")
+
+    args = parser.parse_args()
+    if args.command == "packing":
+        llm = ChatOllama(model=args.model, temperature=0.5)
+        bench_packing(llm, load_article(args), args.chunk_tokens, args.concurrency)
+    elif args.command == "prefilter":
+        llm = ChatOllama(model=args.model, temperature=0.5)
+        bench_prefilter(llm, load_article(args), args.concurrency)
+    elif args.command == "deck":
+        bench_deck(args.cards)
+    elif args.command == "lessons":
+        bench_lessons(args.lessons, args.cards, latency=args.latency, concurrency=args.concurrency)
+    elif args.command == "reviews":
+        bench_reviews(args.cards, args.learners, args.ops)
+    elif args.command == "offline":
+        results = bench_offline(args.runs, args.latency, args.tokens_per_second, args.paragraphs,
+                                args.cards, args.concurrency)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import time
+
+from langchain_core.messages import SystemMessage, HumanMessage
+
+from flashcard_extractor import estimate_tokens
+
+
+class ConversationContext:
+    """
+    Builds the prompt for each chat turn within a token budget.
+
+    The newest messages are sent word for word. When they no longer fit, the
+    oldest ones are folded into a rolling summary with one extra LLM call;
+    the summary is only ever extended with the newly folded messages, never
+    rebuilt from the whole history. The article gets at most article_tokens.
+
+    history is the full list of messages and is shared with the caller (the
+    teacher's message_history), nothing is removed from it.
+    """
+    def __init__(self, llm, history, budget_tokens=3000, article_tokens=1200, keep_recent=4):
+        self.llm = llm
+        self.history = history
+        self.budget_tokens = budget_tokens
+        self.article_tokens = article_tokens
+        self.keep_recent = keep_recent  # messages that are never folded into the summary
+        self.summary = ""
+        self.summarized = 0  # number of messages in history covered by the summary
+        self.turn_stats = []
+
+    @staticmethod
+    def _tokens(messages):
+        return sum(estimate_tokens(m.content) for m in messages)
+
+    def _fold(self, messages):
+        """
+        Extend the rolling summary with messages that drop out of the window.
+        """
+        transcript = "\n".join(f"{m.type}: {m.content}" for m in messages)
+        response = self.llm.invoke([
+            SystemMessage(content="""You keep a short running summary of a conversation between a Swedish teacher and a learner.
+            Update the summary with the new messages. Keep names, topics, questions that were asked and mistakes
+            the learner made. Answer with the updated summary only, at most 150 words, in Swedish."""),
+            HumanMessage(content=f"Summary so far:\n{self.summary or '(empty)'}\n\nNew messages:\n{transcript}")
+        ])
+        # Guard against a runaway summary eating the whole budget (about 4 characters per token)
+        summary = response.content.strip()
+        if estimate_tokens(summary) > self.budget_tokens:
+            summary = summary[:self.budget_tokens * 4]
+        self.summary = summary
+
+    def build(self, system, article):
+        """
+        The messages to send for the current turn: system prompt, (trimmed)
+        article, rolling summary and as many recent messages as the budget allows.
+        """
+        if estimate_tokens(article) > self.article_tokens:
+            article = article[:self.article_tokens * 4] + " …"
+        head = [SystemMessage(content=system), HumanMessage(content=f"Here is the text to discuss: {article}")]
+
+        recent = self.history[self.summarized:]
+        available = self.budget_tokens - self._tokens(head) - estimate_tokens(self.summary)
+        if self._tokens(recent) > available and len(recent) > self.keep_recent:
+            # Fold everything but the newest messages in one go, so the summary
+            # call happens once per overflow and not on every turn
+            keep = self.keep_recent
+            while keep < len(recent) and self._tokens(recent[-(keep + 1):]) <= available // 2:
+                keep += 1
+            self._fold(recent[:-keep])
+            self.summarized += len(recent) - keep
+            recent = self.history[self.summarized:]
+
+        if self.summary:
+            head.append(SystemMessage(content=f"Summary of the earlier conversation: {self.summary}"))
+        return head + recent
+
+    def record(self, messages, response, started):
+        """
+        Store the prompt size and latency of a turn. Uses the token counts
+        reported by Ollama when they are there.
+        """
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.turn_stats.append({
+            "turn": len(self.turn_stats) + 1,
+            "prompt_tokens": usage.get("input_tokens") or self._tokens(messages),
+            "completion_tokens": usage.get("output_tokens") or estimate_tokens(response.content or ""),
+            "messages_verbatim": len(self.history) - self.summarized,
+            "messages_summarized": self.summarized,
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+        return self.turn_stats[-1]
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from typing import List, Optional
+
+from flashcard_extractor import VocabEntry
+
+
+DEFAULT_PATH = os.environ.get("EXTRACTION_CACHE", os.path.join("cache", "extraction.sqlite"))
+
+
+class ExtractionCache:
+    """
+    On-disk cache of parsed extraction results, one row per sentence.
+
+    The key is a hash of model, temperature, system prompt and sentence, so a
+    changed prompt or model never sees old results. When the table grows past
+    max_entries the least recently used rows are evicted.
+
+    Reads don't write: the last-used times of hits are collected in memory
+    and written in one go with the next put() or every touch_batch hits.
+    """
+    def __init__(self, path=DEFAULT_PATH, max_entries=50_000, touch_batch=200):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched = {}  # key -> last used, not written yet
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # precompute.py's worker processes share this file: WAL lets them read
+        # while one writes, and a writer waits for the lock instead of failing
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                entries TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS extractions_last_used ON extractions (last_used)")
+        self._db.commit()
+        # Running row count, so put() only counts the table when it may be full
+        (self._count,) = self._db.execute("SELECT COUNT(*) FROM extractions").fetchone()
+
+    @staticmethod
+    def make_key(model, temperature, system_prompt, sentence) -> str:
+        h = hashlib.sha256()
+        for part in (model, temperature, system_prompt, sentence):
+            h.update(str(part).encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, key) -> Optional[List[VocabEntry]]:
+        with self._lock:
+            row = self._db.execute("SELECT entries FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.touch_batch:
+                self._write_touches()
+                self._db.commit()
+        return [VocabEntry(**item) for item in json.loads(row[0])]
+
+    def put(self, key, entries: List[VocabEntry]):
+        data = json.dumps([asdict(e) for e in entries], ensure_ascii=False)
+        with self._lock:
+            self._write_touches()
+            new = self._db.execute("SELECT 1 FROM extractions WHERE key = ?", (key,)).fetchone() is None
+            self._db.execute(
+                "INSERT OR REPLACE INTO extractions (key, entries, last_used) VALUES (?, ?, ?)",
+                (key, data, time.time()),
+            )
+            self._count += new
+            if self._count > self.max_entries:
+                self._evict()
+            self._db.commit()
+
+    def _write_touches(self):
+        if self._touched:
+            self._db.executemany("UPDATE extractions SET last_used = ? WHERE key = ?",
+                                 [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def flush(self):
+        """
+        Write the pending last-used times (e.g. before shutting down).
+        """
+        with self._lock:
+            self._write_touches()
+            self._db.commit()
+
+    def _evict(self):
+        # Other processes may share the file, so count for real before deleting
+        (count,) = self._db.execute("SELECT COUNT(*) FROM extractions").fetchone()
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM extractions WHERE key IN "
+                "(SELECT key FROM extractions ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+            count = self.max_entries
+        self._count = count
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM extractions")
+            self._db.commit()
+            self._touched.clear()
+            self._count = 0
+            self.hits = self.misses = 0
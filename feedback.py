@@ -0,0 +1,101 @@
+import json
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from langchain_core.messages import SystemMessage, HumanMessage
+
+
+# Shared by all sessions, so many learners don't mean many threads
+executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="feedback")
+log = logging.getLogger(__name__)
+
+FEEDBACK_PROMPT = "Please provide feedback on the following message in terms of how correct it is: "
+
+
+class FeedbackTracker:
+    """
+    Grammar feedback per learner message, computed in the background.
+
+    Every human message is queued as soon as it arrives. A background job
+    takes everything that is queued (up to batch_size messages) and asks for
+    all of it in one request. Results are kept per message, so asking for
+    feedback later only waits for messages that are still being evaluated.
+    """
+    def __init__(self, llm, batch_size=5):
+        self.llm = llm
+        self.batch_size = batch_size
+        self.results = []     # one Future per human message, in conversation order
+        self._by_text = {}    # message text -> Future, repeated messages are evaluated once
+        self._pending = []    # (text, future) not yet sent to the LLM
+        self._seen = 0        # human messages of the history already queued
+        self._lock = threading.Lock()
+
+    def submit(self, text):
+        with self._lock:
+            future = self._by_text.get(text)
+            if future is None:
+                future = self._by_text[text] = Future()
+                self._pending.append((text, future))
+            self.results.append(future)
+        executor.submit(self._flush)
+
+    def sync(self, history):
+        """
+        Queue the human messages of history that have not been seen yet.
+        """
+        human = [m.content for m in history if m.type == "human"]
+        # Claim the new messages under the lock, so a chat turn and a feedback
+        # request syncing at the same time don't both queue them
+        with self._lock:
+            new, self._seen = human[self._seen:], max(self._seen, len(human))
+        for text in new:
+            self.submit(text)
+
+    def _flush(self):
+        with self._lock:
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        if not batch:
+            return
+        if self._pending:
+            executor.submit(self._flush)
+
+        try:
+            answers = self._evaluate_batch([text for text, _ in batch]) if len(batch) > 1 else None
+        except Exception as e:
+            log.warning("Batched feedback failed, evaluating one by one: %s", e)
+            answers = None
+
+        for i, (text, future) in enumerate(batch):
+            try:
+                future.set_result(answers[i] if answers else self.llm.invoke(FEEDBACK_PROMPT + text).content)
+            except Exception as e:
+                future.set_result(f"⚠️ Kunde inte ge feedback: {e}")
+
+    def _evaluate_batch(self, texts):
+        numbered = "\n".join(f"{i}. {text}" for i, text in enumerate(texts, start=1))
+        response = self.llm.invoke([
+            SystemMessage(content="""You give feedback to a Swedish learner at B2/C1 level.
+            For each numbered message, provide feedback in terms of how correct it is.
+            Return a JSON list of strings, one feedback text per message in the same order,
+            without markdown or formatting."""),
+            HumanMessage(content=numbered),
+        ])
+        cleaned = "\n".join(l for l in response.content.splitlines() if not l.strip().startswith("```"))
+        answers = json.loads(cleaned)
+        if not isinstance(answers, list) or len(answers) != len(texts):
+            raise ValueError(f"expected {len(texts)} feedback texts, got {answers!r:.200}")
+        return [str(a) for a in answers]
+
+    def iter_feedback(self, job=None):
+        """
+        Yields the feedback per message in conversation order, waiting only for
+        messages that are still being evaluated. With a jobs.Job the waiting
+        stops (JobCancelled) once it is cancelled or times out; the evaluations
+        themselves carry on, their results are kept for the next call.
+        """
+        for future in list(self.results):
+            while job is not None and not future.done():
+                job.check()
+                wait([future], timeout=0.1)
+            yield future.result()
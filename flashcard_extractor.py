@@ -2,12 +2,21 @@ from langchain_ollama import ChatOllama
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 
 
+import asyncio
 import json
+import logging
+import queue
 import re
+import threading
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 
-@dataclass
+from sentence_filter import segment_sentences, worth_extracting
+from jobs import JobCancelled
+
+log = logging.getLogger(__name__)
+
+@dataclass(slots=True)  # no per-card __dict__
 class VocabEntry:
     term: str
     part_of_speech: str
@@ -16,12 +25,100 @@ class VocabEntry:
     extra_note: str
 
 
+def normalize_term(term: str) -> str:
+    """
+    The key a term is compared and stored under: lower case, no markdown or
+    surrounding punctuation, single spaces, and without a leading article or "att".
+    """
+    key = re.sub(r"[*_`\"“”'’]", "", term).lower()
+    key = re.sub(r"\s+", " ", key).strip(" .,;:!?()[]")
+    return re.sub(r"^(en|ett|att) (?=\w)", "", key)
+
+
+# JSON schemas for Ollama's structured output (format=...), matching VocabEntry
+_ENTRY_PROPERTIES = {field: {"type": "string"} for field in VocabEntry.__annotations__}
+VOCAB_SCHEMA = {
+    "type": "array",
+    "items": {"type": "object", "properties": _ENTRY_PROPERTIES, "required": list(_ENTRY_PROPERTIES)},
+}
+CHUNK_VOCAB_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": dict({"sentence": {"type": "integer"}}, **{f: t for f, t in _ENTRY_PROPERTIES.items() if f != "example"}),
+        "required": ["sentence"] + [f for f in _ENTRY_PROPERTIES if f != "example"],
+    },
+}
+
+
+class IncrementalJSONParser:
+    """
+    Picks complete JSON objects out of a (streamed) array as they arrive.
+
+    feed() takes the next piece of text and returns the objects that were
+    completed by it. Objects that don't parse are skipped, text outside of
+    objects (fences, commas, a missing closing bracket, chatter) is ignored,
+    so a truncated or slightly broken array still gives its complete entries.
+    """
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.current = []
+        self.skipped = 0  # complete objects that were not valid JSON
+
+    def feed(self, text):
+        objects = []
+        for ch in text:
+            if self.depth:
+                self.current.append(ch)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"' and self.depth:
+                self.in_string = True
+            elif ch == "{":
+                if not self.depth:
+                    self.current = [ch]
+                self.depth += 1
+            elif ch == "}" and self.depth:
+                self.depth -= 1
+                if not self.depth:
+                    try:
+                        objects.append(json.loads("".join(self.current)))
+                    except json.JSONDecodeError:
+                        self.skipped += 1
+        return objects
+
+
 
 
 class FlashcardExtractor:
-    def __init__(self, llm, article):
+    def __init__(self, llm, article, max_concurrency=1, chunk_tokens=None, cache=None,
+                 structured=True, retries=1, prefilter=True, known_terms=None, job=None, request_timeout=None):
         self.llm = llm
         self.article = article
+        # Optional jobs.Job: once it is cancelled no further requests are sent,
+        # requests in flight are dropped and the extraction raises JobCancelled
+        self.job = job
+        self.request_timeout = request_timeout  # seconds per async LLM request, a timeout counts as a failure
+        # Normalized terms to leave out, e.g. VocabStore.known_terms(); a term
+        # found in several sentences only gives one card either way
+        self.known_terms = set(known_terms or ())
+        self.prefilter = prefilter  # skip noise and basic-vocabulary sentences before they reach the LLM
+        self.structured = structured  # ask Ollama for output matching VOCAB_SCHEMA
+        self.retries = retries  # extra attempts for a request whose reply could not be parsed
+        # Counters for the parse-failure rate: requests sent, replies that needed
+        # recovery, replies that gave nothing usable, retries and units given up on
+        self.stats = {"requests": 0, "recovered": 0, "parse_failures": 0, "retries": 0, "failed": 0,
+                      "sentences": 0, "skipped": 0, "cached": 0}
+        self.cache = cache  # optional ExtractionCache, only cache misses go to the LLM
+        self.max_concurrency = max_concurrency  # number of requests sent to the LLM at once
+        self.chunk_tokens = chunk_tokens  # None = one sentence per request, else token budget per packed chunk
         self.vocab_entries = []
     
         self.system = SystemMessage(content="""
@@ -58,32 +155,321 @@ class FlashcardExtractor:
 
                 """)
 
-    def extract_vocab_entries(self):
+        # Used in chunked mode: several numbered sentences share one request
+        self.chunk_system = SystemMessage(content="""
+                You are a vocabulary‐expansion assistant for a Swedish learner at B2/C1 level.
+                You will see several numbered sentences from a Swedish article, one per line, like "[3] Sentence text".
+                Your task is to identify and extract vocabulary items that are particularly useful or interesting for a language learner at a higher level.
+
+                1. For each sentence, identify between 1 and 3 “interesting” vocabulary items (single words or multi-word phrases) that meet at least one of these criteria:
+                • Less frequent, but useful in journalistic or academic texts.
+                - Useful words or phrases that are not basic vocabulary.
+                • Idiomatic expressions or common collocations.
+                • Words/phrases that convey nuance or are hard to paraphrase.
+                • Topic-specific or domain-specific terms I’m unlikely to know.
+                - Verbs that are irregular.
+                - Words that are commonly used in formal or literary contexts.
+                - Do not include proper nouns, names of people, places, or organizations.
+
+
+                Return one JSON list with the items for all sentences, each with the following structure without markdown or formatting. Do not include any comments or explanations, just the JSON list:
+
+                {{
+                    "sentence": number of the sentence the term comes from,
+                    "term": "word or phrase in bold",
+                    "part_of_speech": "noun/verb/adjective/idiom",
+                    "definition": "concise Swedish definition",
+                    "extra_note": "brief note on formality, register, or collocations"
+                }}
+
+                """)
+
+    def _sentences(self):
         """
-        Extract words from a sentence, ignoring punctuation.
+        Split the article into the sentences that get sent to the LLM. With
+        prefilter, sentences without any non-basic words are left out; the
+        number of those is kept in stats["skipped"].
         """
-        sentences = self.article.split(". ")
+        if not self.prefilter:
+            return [s for s in self.article.split(". ") if s.strip()]
+        sentences = segment_sentences(self.article)
+        kept = [s for s in sentences if worth_extracting(s)]
+        self.stats["sentences"] += len(sentences)
+        self.stats["skipped"] += len(sentences) - len(kept)
+        return kept
 
-        for sentence in sentences:
-            if not sentence.strip():
-                continue
-            
-            # Invoke the LLM with the current sentence
-            response = self.llm.invoke([
+    def _units(self, sentences, indices):
+        """
+        Group the sentences at `indices` into the units sent per request: single
+        sentences, or in chunked mode as many sentences as fit in chunk_tokens.
+        """
+        if not self.chunk_tokens:
+            return [[i] for i in indices]
+
+        units, current, used = [], [], 0
+        for i in indices:
+            tokens = estimate_tokens(sentences[i])
+            if current and used + tokens > self.chunk_tokens:
+                units.append(current)
+                current, used = [], 0
+            current.append(i)
+            used += tokens
+        if current:
+            units.append(current)
+        return units
+
+    def _messages(self, unit, retry=False):
+        if not self.chunk_tokens:
+            messages = [
                 self.system,
-                HumanMessage(content=f"The sentence to analyze is: {sentence}")
-            ])
-            print("Response from LLM:", response.content)  # Debugging output
-            # Parse the response and add to vocabulary
+                HumanMessage(content=f"The sentence to analyze is: {unit[0]}")
+            ]
+        else:
+            numbered = "\n".join(f"[{i}] {sentence}" for i, sentence in enumerate(unit, start=1))
+            messages = [self.chunk_system, HumanMessage(content=f"The sentences to analyze are:\n{numbered}")]
+        if retry:
+            messages.append(HumanMessage(content="Your previous answer could not be parsed. "
+                                                 "Answer with the JSON list only, exactly in the requested structure."))
+        return messages
+
+    def _llm_kwargs(self):
+        if not self.structured:
+            return {}
+        return {"format": CHUNK_VOCAB_SCHEMA if self.chunk_tokens else VOCAB_SCHEMA}
+
+    def _parse_response(self, unit, content):
+        """
+        Parse one LLM reply into a list of entries per sentence in the unit.
+        A reply that is not valid as a whole is recovered entry by entry;
+        returns None if nothing usable is left, which only loses this unit.
+        Returns (per_sentence, complete); complete is False for a recovered
+        reply, which may be missing entries and so is not cached.
+        """
+        log.debug("Response from LLM: %s", content)
+        per_sentence = [[] for _ in unit]
+        sentences = unit if self.chunk_tokens else None
+        try:
+            items = self.parse_vocab_entries(content, sentences)
+        except Exception as e:
+            items = self.recover_vocab_entries(content, sentences)
+            if not items:
+                self.stats["parse_failures"] += 1
+                log.warning("Error processing sentence: %s\n%s", " ".join(unit), e)
+                return None, False
+            self.stats["recovered"] += 1
+            complete = False
+        else:
+            complete = True
+        for item in items:
+            if item:
+                index = unit.index(item.example) if sentences else 0
+                per_sentence[index].append(item)
+        return per_sentence, complete
+
+    def parse_failure_rate(self):
+        return self.stats["parse_failures"] / self.stats["requests"] if self.stats["requests"] else 0.0
+
+    def _cache_key(self, sentence):
+        system = self.chunk_system if self.chunk_tokens else self.system
+        return self.cache.make_key(
+            getattr(self.llm, "model", ""), getattr(self.llm, "temperature", None), system.content, sentence
+        )
+
+    def _plan(self):
+        """
+        Split the article, answer what we can from the cache and group the
+        remaining sentences into requests. Returns (sentences, results, units);
+        results holds the entries per sentence, None where the LLM is needed.
+        """
+        sentences = self._sentences()
+        if self.cache is None:
+            results = [None] * len(sentences)
+        else:
+            results = [self.cache.get(self._cache_key(s)) for s in sentences]
+        misses = [i for i, r in enumerate(results) if r is None]
+        self.stats["cached"] += len(sentences) - len(misses)
+        return sentences, results, self._units(sentences, misses)
+
+    def _store(self, sentences, results, unit, per_sentence, complete=True):
+        if per_sentence is None:
+            return
+        for i, entries in zip(unit, per_sentence):
+            results[i] = entries
+            if self.cache is not None and complete:
+                self.cache.put(self._cache_key(sentences[i]), entries)
+
+    def _fresh(self, entries, seen):
+        """
+        Entries whose term is neither known nor in seen (which is updated).
+        """
+        fresh = []
+        for entry in entries or ():
+            key = normalize_term(entry.term)
+            if key and key not in seen and key not in self.known_terms:
+                seen.add(key)
+                fresh.append(entry)
+        return fresh
+
+    def _collect(self, results):
+        seen = set()
+        for entries in results:
+            self.vocab_entries.extend(self._fresh(entries, seen))
+        return self.vocab_entries
+
+    def _run_unit(self, sentences, results, unit):
+        texts = [sentences[i] for i in unit]
+        # Invoke the LLM with the current sentence(s); retry only if the reply was unusable
+        for attempt in range(self.retries + 1):
             try:
-                vocab_items = self.parse_vocab_entries(response.content)
+                self.stats["requests"] += 1
+                response = self.llm.invoke(self._messages(texts, retry=attempt > 0), **self._llm_kwargs())
+            except Exception as e:
+                log.warning("Error processing sentence: %s\n%s", " ".join(texts), e)
+                break
+            per_sentence, complete = self._parse_response(texts, response.content)
+            if per_sentence is not None:
+                self._store(sentences, results, unit, per_sentence, complete)
+                return
+            self.stats["retries"] += attempt < self.retries
+        self.stats["failed"] += 1
 
-                for item in vocab_items:
-                    if item:
-                        self.vocab_entries.append(item)  # Convert string representation of dict to dict
+    async def _arun_unit(self, sentences, results, unit):
+        texts = [sentences[i] for i in unit]
+        for attempt in range(self.retries + 1):
+            try:
+                self.stats["requests"] += 1
+                response = await asyncio.wait_for(
+                    self.llm.ainvoke(self._messages(texts, retry=attempt > 0), **self._llm_kwargs()),
+                    self.request_timeout,
+                )
             except Exception as e:
-                print(f"Error processing sentence: {sentence}\n{e}")
-        
+                log.warning("Error processing sentence: %s\n%s", " ".join(texts), e)
+                break
+            per_sentence, complete = self._parse_response(texts, response.content)
+            if per_sentence is not None:
+                self._store(sentences, results, unit, per_sentence, complete)
+                return
+            self.stats["retries"] += attempt < self.retries
+        self.stats["failed"] += 1
+
+    def _iter_units(self, sentences, results, units):
+        """
+        Run the units one after another, yielding each unit when it is done.
+        """
+        for unit in units:
+            self._check()
+            self._run_unit(sentences, results, unit)
+            yield unit
+
+    def _check(self):
+        if self.job is not None:
+            self.job.check()
+
+    async def _arun_units(self, sentences, results, units, max_concurrency, on_done):
+        """
+        Run up to max_concurrency units at the same time, calling on_done(unit)
+        as each one finishes.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run(unit):
+            async with semaphore:
+                if self.job is not None and self.job.cancelled:
+                    return  # still waiting for its turn, never sent
+                await self._arun_unit(sentences, results, unit)
+            on_done(unit)
+
+        tasks = [asyncio.ensure_future(run(u)) for u in units]
+        done = asyncio.gather(*tasks)
+        while self.job is not None and not done.done():
+            if self.job.cancelled:
+                done.cancel()  # also cancels the requests in flight and those waiting for the pool
+                break
+            await asyncio.wait([done], timeout=0.1)
+        try:
+            await done
+        except asyncio.CancelledError:
+            # Let the cancelled requests unwind, so their streams are closed
+            # before the loop is, then report why
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._check()
+            raise
+        self._check()
+
+    def extract_vocab_entries(self, max_concurrency=None, progress=None):
+        """
+        Extract words from a sentence, ignoring punctuation.
+
+        With max_concurrency > 1 the requests are sent to the LLM concurrently
+        (see aextract_vocab_entries). progress(done, total) is called after
+        every finished request. Sentences found in the cache skip the LLM.
+        """
+        max_concurrency = max_concurrency or self.max_concurrency
+        if max_concurrency > 1:
+            return asyncio.run(self.aextract_vocab_entries(max_concurrency, progress))
+
+        sentences, results, units = self._plan()
+        for done, _ in enumerate(self._iter_units(sentences, results, units), start=1):
+            if progress:
+                progress(done, len(units))
+        return self._collect(results)
+
+    async def aextract_vocab_entries(self, max_concurrency=None, progress=None):
+        """
+        Same as extract_vocab_entries, but runs up to max_concurrency requests
+        at the same time through the async API of the LLM. The entries are
+        still stored in article order.
+        """
+        max_concurrency = max_concurrency or self.max_concurrency
+        sentences, results, units = self._plan()
+        done = 0
+
+        def on_done(unit):
+            nonlocal done
+            done += 1
+            if progress:
+                progress(done, len(units))
+
+        await self._arun_units(sentences, results, units, max_concurrency, on_done)
+        # results is indexed by sentence, so the entries stay in article order
+        return self._collect(results)
+
+    def iter_vocab_entries(self, max_concurrency=None):
+        """
+        Generator version of extract_vocab_entries: yields each VocabEntry as
+        soon as its sentence or chunk is done (cached sentences first), so the
+        UI can show cards while the rest is still being extracted.
+        vocab_entries ends up in article order once the generator is exhausted.
+        """
+        max_concurrency = max_concurrency or self.max_concurrency
+        sentences, results, units = self._plan()
+        seen = set()
+        for entries in results:
+            yield from self._fresh(entries, seen)
+
+        if max_concurrency > 1:
+            # Run the async extraction in a worker thread and hand finished
+            # units over through a queue; None marks the end.
+            finished = queue.Queue()
+
+            def worker():
+                try:
+                    asyncio.run(self._arun_units(sentences, results, units, max_concurrency, finished.put))
+                except JobCancelled:
+                    pass  # raised again by _check() below, in the caller's thread
+                finally:
+                    finished.put(None)
+
+            threading.Thread(target=worker, daemon=True).start()
+            finished_units = iter(finished.get, None)
+        else:
+            finished_units = self._iter_units(sentences, results, units)
+
+        for unit in finished_units:
+            for i in unit:
+                yield from self._fresh(results[i], seen)
+        self._check()  # a cancelled extraction ends early, don't pass it off as complete
+        self._collect(results)
 
 
     def _strip_code_fences(self,text: str) -> str:
@@ -95,11 +481,15 @@ class FlashcardExtractor:
             if not line.strip().startswith("```")
         )
 
-    def parse_vocab_entries(self,text: str) -> List[VocabEntry]:
+    def parse_vocab_entries(self,text: str, sentences: Optional[List[str]] = None) -> List[VocabEntry]:
         """
         Accepts either raw JSON or a Markdown-fenced JSON block,
         strips any ``` fences, parses the JSON, validates its shape,
         and returns a list of VocabEntry.
+
+        In chunked mode `sentences` holds the sentences of the request; every
+        entry then carries a 1-based "sentence" number instead of an example,
+        and the example is filled in from that sentence.
         """
         cleaned = self._strip_code_fences(text)
         try:
@@ -114,6 +504,11 @@ class FlashcardExtractor:
         for idx, item in enumerate(raw):
             if not isinstance(item, dict):
                 raise ValueError(f"Entry {idx} is not an object")
+            if sentences is not None:
+                try:
+                    item["example"] = sentences[int(item.get("sentence")) - 1]
+                except (TypeError, ValueError, IndexError):
+                    raise ValueError(f"Entry {idx} has no valid 'sentence' number")
             for field in ("term", "part_of_speech", "definition", "example", "extra_note"):
                 if field not in item:
                     raise ValueError(f"Entry {idx} missing required field '{field}'")
@@ -121,5 +516,23 @@ class FlashcardExtractor:
         return entries
 
 
+    def recover_vocab_entries(self, text: str, sentences: Optional[List[str]] = None) -> List[VocabEntry]:
+        """
+        Best-effort version of parse_vocab_entries for broken replies: keeps
+        every complete, valid entry and drops the rest.
+        """
+        entries: List[VocabEntry] = []
+        for item in IncrementalJSONParser().feed(text):
+            try:
+                entries.extend(self.parse_vocab_entries(json.dumps([item]), sentences))
+            except ValueError:
+                continue
+        return entries
 
 
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about 4 characters per token), good enough for packing
+    budgets without loading a tokenizer.
+    """
+    return max(1, len(text) // 4)
@@ -0,0 +1,103 @@
+"""
+HTML for the flashcard panel.
+
+The card style is sent once (CARD_STYLE, rendered by its own component), each
+card's HTML fragment is built once and cached, and a deck is shown one page
+at a time, so updating the panel costs the same for 20 cards or 20 000.
+"""
+import html
+from functools import lru_cache
+
+
+CARD_STYLE = """<style>
+    body {
+        background: #18181b;
+        font-family: 'Segoe UI', Arial, sans-serif;
+        margin: 0;
+        padding: 0;
+    }
+    .flashcards {
+        display: flex;
+        flex-wrap: wrap;
+        gap: 24px;
+        margin: 32px auto;
+        justify-content: center;
+        max-width: 1000px;
+    }
+    .card {
+        background: linear-gradient(135deg, #23232a 60%, #18181b 100%);
+        border: none;
+        border-radius: 18px;
+        box-shadow: 0 4px 24px rgba(0,0,0,0.25), 0 1.5px 4px rgba(0,0,0,0.18);
+        padding: 28px 22px 20px 22px;
+        width: 300px;
+        text-align: left;
+        transition: transform 0.15s, box-shadow 0.15s;
+        position: relative;
+    }
+    .card:hover {
+        transform: translateY(-6px) scale(1.03);
+        box-shadow: 0 8px 32px rgba(0,0,0,0.35), 0 2px 8px rgba(0,0,0,0.22);
+    }
+    .card strong {
+        color: #60a5fa;
+        font-size: 1.25em;
+        letter-spacing: 0.02em;
+    }
+    .card p {
+        margin: 0.5em 0;
+        color: #f3f4f6;
+        font-size: 1.07em;
+        line-height: 1.5;
+    }
+    .card i {
+        color: #a1a1aa;
+        font-size: 0.98em;
+    }
+    .card::before {
+        content: "";
+        display: block;
+        width: 36px;
+        height: 4px;
+        background: linear-gradient(90deg, #60a5fa 60%, #818cf8 100%);
+        border-radius: 2px;
+        margin-bottom: 14px;
+    }
+</style>"""
+
+PAGE_SIZE = 30
+
+
+@lru_cache(maxsize=20_000)
+def _card_fragment(term, part_of_speech, definition, example, extra_note):
+    term, part_of_speech, definition, example, extra_note = (
+        html.escape(str(v)) for v in (term, part_of_speech, definition, example, extra_note)
+    )
+    return f"""    <div class='card'>
+        <p><strong>{term}</strong> <span style="color:#a1a1aa;">({part_of_speech})</span><br>
+            {definition}</p>
+        <p><i><span style="color:#fbbf24;">{example}</span></i><br>
+            {extra_note}
+        </p>
+    </div> """
+
+
+def card_html(c):
+    return _card_fragment(c.term, c.part_of_speech, c.definition, c.example, c.extra_note)
+
+
+def page_count(cards, page_size=PAGE_SIZE):
+    return max(1, -(-len(cards) // page_size))
+
+
+def page_cards(cards, page, page_size=PAGE_SIZE):
+    page = min(max(page, 0), page_count(cards, page_size) - 1)
+    return cards[page * page_size:(page + 1) * page_size]
+
+
+def render_page(cards, page=0, page_size=PAGE_SIZE):
+    """
+    The cards of one page, without the style block.
+    """
+    fragments = [card_html(c) for c in page_cards(cards, page, page_size)]
+    return "<div class='flashcards'>" + "".join(fragments) + "</div>"
@@ -1,115 +1,96 @@
+import time
+
 import gradio as gr
-from llm_utils import random_topics, AITeacher
+from llm_utils import topic_pool, AITeacher, pool
+from session_manager import SessionManager
+import metrics
+from vocab_deck import VocabDeck
+from flashcard_render import CARD_STYLE, render_page, page_cards, page_count, card_html
 
 # Placeholder backend functions
 
-ai = AITeacher(model="gemma3:4b", temperature=0.5)
+# One teacher per browser session; they all share the LLM pool and the caches
+# and each learner (login or session) gets their own cards and review queue
+sessions = SessionManager(lambda sid, learner: AITeacher(session=sid, learner=learner,
+                                                        anonymous=SessionManager.anonymous(learner)),
+                          max_sessions=50, idle_timeout=30 * 60, on_drop=AITeacher.close)
 
 
-def get_subtopics(topic, other_text):
-    choices = ai.search_wiki(topic)
+def get_subtopics(topic, other_text, request: gr.Request):
+    choices = sessions.get(request).search_wiki(topic)
     return choices
 
-def display_article(subtopic):
-    return ai.fetch_wiki_article(subtopic) if subtopic else "*Ingen artikel vald.*"
-
-def get_vocab_cards(subtopic):
-    cards = ai.get_vocab()
-    return cards 
-
-def build_flashcard_html(cards):
-    style = '''
-<style>
-    body {
-        background: #18181b;
-        font-family: 'Segoe UI', Arial, sans-serif;
-        margin: 0;
-        padding: 0;
-    }
-    .flashcards {
-        display: flex;
-        flex-wrap: wrap;
-        gap: 24px;
-        margin: 32px auto;
-        justify-content: center;
-        max-width: 1000px;
-    }
-    .card {
-        background: linear-gradient(135deg, #23232a 60%, #18181b 100%);
-        border: none;
-        border-radius: 18px;
-        box-shadow: 0 4px 24px rgba(0,0,0,0.25), 0 1.5px 4px rgba(0,0,0,0.18);
-        padding: 28px 22px 20px 22px;
-        width: 300px;
-        text-align: left;
-        transition: transform 0.15s, box-shadow 0.15s;
-        position: relative;
-    }
-    .card:hover {
-        transform: translateY(-6px) scale(1.03);
-        box-shadow: 0 8px 32px rgba(0,0,0,0.35), 0 2px 8px rgba(0,0,0,0.22);
-    }
-    .card strong {
-        color: #60a5fa;
-        font-size: 1.25em;
-        letter-spacing: 0.02em;
-    }
-    .card p {
-        margin: 0.5em 0;
-        color: #f3f4f6;
-        font-size: 1.07em;
-        line-height: 1.5;
-    }
-    .card i {
-        color: #a1a1aa;
-        font-size: 0.98em;
-    }
-    .card::before {
-        content: "";
-        display: block;
-        width: 36px;
-        height: 4px;
-        background: linear-gradient(90deg, #60a5fa 60%, #818cf8 100%);
-        border-radius: 2px;
-        margin-bottom: 14px;
-    }
-</style>
-    '''
-    html = style + "<div class='flashcards'>"
-    for c in cards:
-        html += f"""    <div class='card'>
-        <p><strong>{c.term}</strong> <span style="color:#a1a1aa;">({c.part_of_speech})</span><br>
-            {c.definition}</p>
-        <p><i><span style="color:#fbbf24;">{c.example}</span></i><br>
-            {c.extra_note}
-        </p>
-    </div> """
-    html += "</div>"
-    return html
-
-def remove_flashcards(flashcards, remaining):
-    # flashcards: List[YourCardDataclass]
-    # remaining: List[str] (terms that the user wants to keep)
+def display_article(subtopics, request: gr.Request):
+    return sessions.get(request).fetch_wiki_articles(subtopics) if subtopics else "*Ingen artikel vald.*"
 
-    # 1. Keep only card‐objects whose term is in `remaining`
-    updated_cards = [card for card in flashcards if card.term in remaining]
+def get_vocab_cards(subtopic, request):
+    # Yields the growing list of cards while the article is being processed
+    return sessions.get(request).stream_vocab()
 
-    # 2. Rebuild the HTML from the filtered list of card‐objects
-    html = build_flashcard_html(updated_cards)
+def end_session(request: gr.Request):
+    sessions.drop(request)
 
-    # 3. Prepare the new set of terms for the CheckboxGroup
-    remaining_terms = [card.term for card in updated_cards]
+def build_flashcard_html(cards, page=0):
+    # Only the cards of one page; the style is rendered once by CARD_STYLE
+    return render_page(cards, page)
 
-    # 4. Return:
-    #    a) the updated list of card‐objects (state)
-    #    b) the new HTML
-    #    c) a gr.update for the CheckboxGroup (choices + selected values)
+def page_update(cards, page):
+    """
+    Panel outputs for one page: HTML, the page's checkboxes and the page label.
+    """
+    page = min(max(page, 0), page_count(cards) - 1)
+    terms = [c.term for c in page_cards(cards, page)]
     return (
-        updated_cards,
-        html,
-        gr.update(choices=remaining_terms, value=remaining_terms)
+        gr.update(value=build_flashcard_html(cards, page), visible=True),
+        gr.update(choices=terms, value=terms, visible=True),
+        page,
+        f"Sida {page + 1} av {page_count(cards)} ({len(cards)} kort)",
     )
 
+def remove_flashcards(flashcards, remaining, page):
+    # flashcards: List[YourCardDataclass]
+    # remaining: List[str] (terms on the current page that the user wants to keep)
+
+    # 1. The checkboxes only cover the current page, so everything unticked there is dropped
+    shown = {card.term for card in page_cards(flashcards, page)}
+    dropped = shown - set(remaining)
+
+    # 2. Filter the columns by set membership instead of searching the list for every card
+    updated_cards = flashcards.without_terms(dropped) if dropped else flashcards
+
+    # 3. Return the updated deck (state) and the re-rendered current page
+    return (updated_cards,) + page_update(updated_cards, page)
+
+def change_page(flashcards, page, step):
+    return page_update(flashcards, page + step)
+
+# Review buttons and the SM-2 quality they stand for
+GRADES = {"Igen": 1, "Svårt": 3, "Bra": 4, "Lätt": 5}
+
+def keep_for_review(flashcards, request: gr.Request):
+    ai = sessions.get(request)
+    new = ai.reviews.add(flashcards, ai.learner)
+    return f"{new} nya kort sparade för repetition ({ai.reviews.due_count(ai.learner)} att repetera nu)."
+
+def next_review(request: gr.Request):
+    """
+    Review outputs for the next due card: its term, the question, the hidden
+    answer and the due count.
+    """
+    ai = sessions.get(request)
+    card = ai.reviews.next_card(ai.learner)
+    due = f"{ai.reviews.due_count(ai.learner)} av {ai.reviews.count(ai.learner)} kort att repetera"
+    if card is None:
+        return "", "*Inga kort att repetera just nu.*", gr.update(value="", visible=False), due
+    answer = "<div class='flashcards'>" + card_html(card) + "</div>"
+    return card.term, f"### {card.term}", gr.update(value=answer, visible=False), due
+
+def grade_review(term, grade, request: gr.Request):
+    if term:
+        ai = sessions.get(request)
+        ai.reviews.grade(term, GRADES[grade], ai.learner)
+    return next_review(request)
+
 
 def build_ui():
     with gr.Blocks(css="styles.css", title="Swedish Course GUI") as demo:
@@ -117,8 +98,9 @@ def build_ui():
 
         # 1. Topic selection
         with gr.Row():
+            # Topics come from the pre-generated pool; no LLM call while building the UI
             topic_dd = gr.Dropdown(
-                choices=random_topics(),
+                choices=topic_pool.choices(),
             )
             other_txt = gr.Textbox(visible=False, placeholder="Skriv in eget ämne...")
 
@@ -128,9 +110,9 @@ def build_ui():
             sub_cb = gr.CheckboxGroup(choices=[], label="Underämnen", visible=False)
             sub_btn = gr.Button("Bekräfta underämnen")
 
-        def on_topic_change(topic, other_text):
+        def on_topic_change(topic, other_text, request: gr.Request):
             show_other = topic == "Other"
-            subs = get_subtopics(topic, other_text)
+            subs = get_subtopics(topic, other_text, request)
             return (
                 gr.update(visible=show_other),
                 gr.update(choices=subs, visible=True),
@@ -147,8 +129,8 @@ def build_ui():
         article_accordion = gr.Accordion("3. Artikelvisning", open=False, visible=False)
         with article_accordion:
             article_box = gr.HTML(value="*Din artikel kommer visas här*.")
-            sub_btn.click(
-                lambda subs: display_article(subs[0] if subs else ""),
+            show_article = sub_btn.click(
+                display_article,
                 inputs=sub_cb,
                 outputs=article_box
             )
@@ -157,27 +139,55 @@ def build_ui():
         vocab_accordion = gr.Accordion("4. Ordförråd", open=False, visible=False)
         with vocab_accordion:
             vocab_btn = gr.Button("Visa flashcards")
-            flashcards_state = gr.State([])
+            flashcards_state = gr.State(VocabDeck())
+            page_state = gr.State(0)
+            gr.HTML(CARD_STYLE)  # sent once, not with every page of cards
             flashcards_cb = gr.CheckboxGroup(label="Välj vilka kort att behålla", visible=False)
             vocab_html = gr.HTML(visible=False)
+            with gr.Row():
+                prev_btn = gr.Button("◀", size="sm")
+                page_label = gr.Markdown("")
+                next_btn = gr.Button("▶", size="sm")
+            panel = [vocab_html, flashcards_cb, page_state, page_label]
 
-            def show_cards(subs):
-                cards = get_vocab_cards(subs[0] if subs else "")
-                html = build_flashcard_html(cards)
-                words = [w.term for w in cards]
-                return cards, gr.update(value=html, visible=True), gr.update(choices=words, value=words, visible=True)
+            def show_cards(subs, request: gr.Request):
+                # Generator: Gradio re-renders the panel on every yield while
+                # the cards are still being extracted
+                for cards in get_vocab_cards(subs[0] if subs else "", request):
+                    yield (cards,) + page_update(cards, 0)
 
             vocab_btn.click(
                 show_cards,
                 inputs=sub_cb,
-                outputs=[flashcards_state, vocab_html, flashcards_cb]
+                outputs=[flashcards_state] + panel
+            )
+            # Start filling the panel as soon as the article has been rendered
+            show_article.then(
+                show_cards,
+                inputs=sub_cb,
+                outputs=[flashcards_state] + panel
             )
 
-            flashcards_cb.change(
+            # .input only fires for the learner's clicks, not for our own updates
+            flashcards_cb.input(
                 remove_flashcards,
-                inputs=[flashcards_state, flashcards_cb],
-                outputs=[flashcards_state, vocab_html, flashcards_cb]
+                inputs=[flashcards_state, flashcards_cb, page_state],
+                outputs=[flashcards_state] + panel
             )
+            prev_btn.click(
+                lambda cards, page: change_page(cards, page, -1),
+                inputs=[flashcards_state, page_state],
+                outputs=panel
+            )
+            next_btn.click(
+                lambda cards, page: change_page(cards, page, 1),
+                inputs=[flashcards_state, page_state],
+                outputs=panel
+            )
+
+            keep_btn = gr.Button("Spara korten för repetition")
+            keep_status = gr.Markdown("")
+            keep_btn.click(keep_for_review, inputs=flashcards_state, outputs=keep_status)
 
         # 5. Chat
         chat_accordion = gr.Accordion("5. Chatta med AI", open=False, visible=False)
@@ -185,8 +195,14 @@ def build_ui():
             chat = gr.Chatbot()
             user_input = gr.Textbox(placeholder="Skriv ditt meddelande...")
             send_btn = gr.Button("Skicka")
+            def send_message(msg, hist, request: gr.Request):
+                # Stream the answer into the last chat bubble as it is generated
+                ai = sessions.get(request)
+                for reply in ai.stream_diskussion(msg, ai.article):
+                    yield hist + [[msg, reply]]
+
             send_btn.click(
-                lambda msg, hist: hist + [[msg, "Placeholder AI svar"]],
+                send_message,
                 inputs=[user_input, chat],
                 outputs=chat
             )
@@ -196,8 +212,11 @@ def build_ui():
         with feedback_accordion:
             feedback_btn = gr.Button("Få feedback")
             feedback_box = gr.Textbox(visible=False)
+            def stream_feedback(hist, request: gr.Request):
+                yield from sessions.get(request).stream_feedback()
+
             feedback_btn.click(
-                lambda hist: "Placeholder feedback på dina meddelanden",
+                stream_feedback,
                 inputs=chat,
                 outputs=feedback_box
             )
@@ -207,6 +226,27 @@ def build_ui():
                 outputs=feedback_box
             )
 
+        # 7. Review of the kept cards, independent of the current article
+        review_accordion = gr.Accordion("7. Repetition", open=False)
+        with review_accordion:
+            review_term = gr.State("")
+            review_due = gr.Markdown("")
+            review_question = gr.Markdown("")
+            review_answer = gr.HTML(visible=False)
+            show_btn = gr.Button("Visa svar")
+            with gr.Row():
+                grade_btns = [gr.Button(grade, size="sm") for grade in GRADES]
+            review_outputs = [review_term, review_question, review_answer, review_due]
+
+            show_btn.click(lambda: gr.update(visible=True), inputs=None, outputs=review_answer)
+            for btn in grade_btns:
+                btn.click(
+                    grade_review,
+                    inputs=[review_term, btn],
+                    outputs=review_outputs
+                )
+            review_accordion.expand(next_review, inputs=None, outputs=review_outputs)
+
         # Reveal remaining steps after confirming subtopics
         def reveal_rest(subs):
             return [gr.update(visible=True)] * 4
@@ -222,9 +262,19 @@ def build_ui():
             ]
         )
 
+        # Fresh topics from the pool for every page load
+        demo.load(lambda: gr.update(choices=topic_pool.choices()), outputs=topic_dd)
+
+        # Free the session's teacher when the tab is closed
+        demo.unload(end_session)
+
     return demo
 
 
 if __name__ == "__main__":
+    started = time.perf_counter()
     demo = build_ui()
+    print(f"UI ready in {time.perf_counter() - started:.2f} s")
+    metrics.setup(health=pool.status)  # logging, trace log, /metrics and /health endpoints
+    pool.start()  # load the models in the background and keep them resident
     demo.launch()
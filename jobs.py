@@ -0,0 +1,99 @@
+"""
+Cancellable jobs, so the work for a learner's old selection stops when they
+pick something new.
+
+A Job is a cancellation flag with an optional time limit. Long-running work
+(fetching, vocabulary extraction, chat and feedback) checks it between steps
+with job.check(), which raises JobCancelled once the job was cancelled,
+superseded or ran out of time. Jobs holds the current job per kind for one
+session; starting a job cancels the jobs it supersedes.
+"""
+import threading
+import time
+
+
+# Seconds a job of each kind may take before it is cancelled. Fetches have no
+# limit of their own, the Wikipedia requests in wiki_utils time out already
+TIMEOUTS = {"extract": 15 * 60, "chat": 3 * 60, "feedback": 3 * 60}
+
+# Seconds one extraction request may take; a hung request only loses its
+# sentences instead of holding the whole extraction until its job times out
+REQUEST_TIMEOUT = 2 * 60
+
+# Running jobs that a new job of a kind makes pointless: a new article means
+# the extraction of the old one is no longer wanted
+SUPERSEDES = {
+    "fetch": ("fetch", "extract"),
+    "extract": ("extract",),
+    "chat": ("chat",),
+    "feedback": ("feedback",),
+}
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job that was cancelled, superseded or timed out.
+    """
+
+
+class Job:
+    def __init__(self, kind, timeout=None):
+        self.kind = kind
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.reason = None  # why it was cancelled: "superseded", "timeout", "closed", ...
+        self._event = threading.Event()
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.remaining() == 0:
+            self.cancel("timeout")
+        return self._event.is_set()
+
+    def remaining(self):
+        # Seconds left, None without a time limit
+        if self.timeout is None:
+            return None
+        return max(0.0, self.timeout - (time.monotonic() - self.started))
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled(f"{self.kind} job {self.reason}")
+
+    def __repr__(self):
+        return f"Job({self.kind!r}, {'cancelled: ' + self.reason if self.cancelled else 'running'})"
+
+
+class Jobs:
+    """
+    The current jobs of one session, one per kind.
+    """
+    def __init__(self, timeouts=None):
+        self.timeouts = dict(TIMEOUTS, **(timeouts or {}))
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, kind):
+        job = Job(kind, self.timeouts.get(kind))
+        with self._lock:
+            for other in SUPERSEDES.get(kind, (kind,)):
+                old = self._jobs.pop(other, None)
+                if old is not None:
+                    old.cancel("superseded")
+            self._jobs[kind] = job
+        return job
+
+    def is_current(self, job):
+        with self._lock:
+            return self._jobs.get(job.kind) is job and not job.cancelled
+
+    def cancel_all(self, reason="closed"):
+        with self._lock:
+            jobs, self._jobs = list(self._jobs.values()), {}
+        for job in jobs:
+            job.cancel(reason)
@@ -0,0 +1,146 @@
+"""
+Precomputed lessons: article text, rendered HTML and vocabulary of a Wikipedia
+page, written by precompute.py and loaded by AITeacher instead of fetching and
+extracting live.
+
+A library is a directory (LESSON_LIBRARY, default cache/lessons) with two files:
+
+    lessons.bin   the lessons one after another; per lesson the article text,
+                  the HTML and the vocabulary deck, each zlib-compressed
+    index.jsonl   one line per saved lesson: title, offset and size of its
+                  sections (a later line for the same title replaces it);
+                  lessons are looked up by their exact title
+
+Opening a library only reads the index. lessons.bin is memory-mapped and a
+lesson's sections are decompressed the first time they are used, so a large
+catalogue costs nothing until the learner picks a lesson.
+"""
+import json
+import mmap
+import os
+import threading
+import time
+import zlib
+from functools import cached_property
+
+from vocab_deck import VocabDeck
+
+DEFAULT_PATH = os.environ.get("LESSON_LIBRARY", os.path.join("cache", "lessons"))
+SECTIONS = ("content", "html", "vocab")
+
+
+class Lesson:
+    """
+    One lesson of a library. content, html and vocab (a VocabDeck) are read
+    from the mapped file when first accessed.
+    """
+    def __init__(self, title, data, offset, sizes):
+        self.title = title
+        self._data = data
+        self._offset = offset
+        self._sizes = sizes
+
+    def _section(self, name):
+        i = SECTIONS.index(name)
+        start = self._offset + sum(self._sizes[:i])
+        return zlib.decompress(self._data[start:start + self._sizes[i]])
+
+    @cached_property
+    def content(self):
+        return self._section("content").decode("utf-8")
+
+    @cached_property
+    def html(self):
+        return self._section("html").decode("utf-8")
+
+    @cached_property
+    def vocab(self):
+        return VocabDeck.from_bytes(self._section("vocab"))
+
+    def page(self):
+        # Same shape as a wiki_utils page
+        return {"content": self.content, "html": self.html}
+
+
+class LessonLibrary:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.data_path = os.path.join(path, "lessons.bin")
+        self.index_path = os.path.join(path, "index.jsonl")
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = {}
+        self._index_pos = 0  # bytes of index.jsonl read so far
+        self._map = None
+
+    def _refresh(self):
+        # Read the index lines added since the last call, e.g. by a running precompute.py
+        try:
+            with open(self.index_path, "rb") as f:
+                f.seek(self._index_pos)
+                new = f.read()
+        except FileNotFoundError:
+            return
+        complete = new[:new.rfind(b"\n") + 1]  # a half written last line is read next time
+        for line in complete.splitlines():
+            entry = json.loads(line)
+            self._index[entry["title"].strip()] = entry
+        self._index_pos += len(complete)
+
+    def _mapped(self, end):
+        # The mapping only covers the file as it was when mapped; map again if it has grown
+        if self._map is None or len(self._map) < end:
+            with open(self.data_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def has(self, title):
+        with self._lock:
+            self._refresh()
+            return title.strip() in self._index
+
+    def titles(self):
+        with self._lock:
+            self._refresh()
+            return sorted(entry["title"] for entry in self._index.values())
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+    def save(self, title, content, html, vocab):
+        """
+        Append a lesson and point the index at it (a lesson saved again replaces the old one).
+        """
+        deck = vocab if isinstance(vocab, VocabDeck) else VocabDeck(vocab)
+        sections = [zlib.compress(content.encode("utf-8")), zlib.compress(html.encode("utf-8")),
+                    zlib.compress(deck.to_bytes())]
+        with self._lock:
+            with open(self.data_path, "ab") as f:
+                offset = f.tell()
+                f.write(b"".join(sections))
+            entry = {
+                "title": title.strip(),
+                "offset": offset,
+                "sizes": [len(s) for s in sections],
+                "cards": len(deck),
+                "created": time.time(),
+            }
+            # The data is written before its index line, so an interrupted run
+            # never leaves an entry pointing at a half lesson
+            with open(self.index_path, "ab") as f:
+                f.write(json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n")
+            self._refresh()
+
+    def load(self, title):
+        """
+        The Lesson for title, or None. Nothing is read until its fields are used.
+        """
+        with self._lock:
+            self._refresh()
+            entry = self._index.get(title.strip())
+            if entry is None:
+                return None
+            data = self._mapped(entry["offset"] + sum(entry["sizes"]))
+        return Lesson(entry["title"], data, entry["offset"], entry["sizes"])
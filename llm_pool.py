@@ -0,0 +1,317 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+from ollama_backend import OllamaBackend, DEFAULT_URL
+from metrics import trace, usage
+
+
+# Which model does which job. Extraction is many small requests, so it can
+# run on a smaller, faster model than the chat.
+DEFAULT_ROUTES = {
+    "chat": "gemma3:4b",
+    "feedback": "gemma3:4b",
+    "topics": "gemma3:4b",
+    "extract": "gemma3:4b",
+    "summary": "gemma3:4b",
+}
+
+POLL = 0.1  # seconds between checks of a cancelled job while a thread waits for a slot
+
+
+class Endpoint:
+    """
+    One Ollama server with a limit on concurrent requests. The queue depth
+    (running + waiting requests) is what the pool balances on.
+
+    Callers from any thread or event loop wait in one FIFO queue; release()
+    hands the freed slot straight to the first of them. A caller that gives
+    up while waiting (a cancelled task, a timeout) leaves the queue again and
+    passes on a slot it was handed in the meantime.
+    """
+    def __init__(self, url, max_concurrency=2):
+        self.url = url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.waiting = 0
+        self._free = max_concurrency
+        self._waiters = deque()  # threading.Event (sync callers) or (loop, future) (async callers)
+        self._lock = threading.Lock()
+
+    @property
+    def load(self):
+        return (self.in_flight + self.waiting) / self.max_concurrency
+
+    def _acquired(self):
+        with self._lock:
+            self.waiting -= 1
+            self.in_flight += 1
+
+    def _gave_up(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def _try_take(self):
+        # Under self._lock: take a free slot unless others are queued before us
+        if self._free and not self._waiters:
+            self._free -= 1
+            return True
+        return False
+
+    def acquire(self, timeout=None, job=None):
+        """
+        Wait for a slot. Gives up with TimeoutError after timeout seconds, or
+        with JobCancelled once job is cancelled; a thread can't be cancelled
+        like a task, so the wait checks both every POLL seconds.
+        """
+        with self._lock:
+            event = None if self._try_take() else threading.Event()
+            if event is not None:
+                self._waiters.append(event)
+        if event is not None:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            # set by _hand_over together with the slot
+            while not event.wait(POLL if deadline is None else min(POLL, max(0.0, deadline - time.monotonic()))):
+                if job is not None and job.cancelled:
+                    self._abandon_event(event)
+                    job.check()
+                if deadline is not None and time.monotonic() >= deadline:
+                    self._abandon_event(event)
+                    raise TimeoutError(f"no free slot on {self.url} after {timeout}s")
+        self._acquired()
+
+    def _abandon_event(self, event):
+        with self._lock:
+            try:
+                self._waiters.remove(event)
+                handed = False
+            except ValueError:
+                handed = True
+        self._gave_up()
+        if handed:
+            self._hand_over()  # set() came too late, pass the slot on
+
+    async def aacquire(self):
+        # Waits on a future of this loop, so the event loop keeps running
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            future = None if self._try_take() else loop.create_future()
+            if future is not None:
+                self._waiters.append((loop, future))
+        if future is not None:
+            try:
+                await future
+            except BaseException:
+                self._abandon(loop, future)
+                raise
+        self._acquired()
+
+    def _abandon(self, loop, future):
+        with self._lock:
+            try:
+                self._waiters.remove((loop, future))
+                handed = False
+            except ValueError:
+                handed = True
+        self._gave_up()
+        if handed and future.done() and not future.cancelled():
+            self._hand_over()  # we were given the slot but won't use it
+
+    def _grant(self, future):
+        # Runs in the waiter's loop; a waiter cancelled in the meantime passes the slot on
+        if future.done():
+            self._hand_over()
+        else:
+            future.set_result(None)
+
+    def _hand_over(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                try:
+                    loop.call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:
+                    continue  # its loop is closed, nobody is waiting there any more
+            self._free += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._hand_over()
+
+
+class LLMPool:
+    """
+    Shared LLM clients for the whole process, spread over one or more Ollama
+    endpoints.
+
+    for_task(task) returns a client-like object (invoke/ainvoke/stream/astream)
+    for the model routed to that task. Each request goes to the endpoint with
+    the shortest queue relative to its concurrency limit and waits there for
+    a free slot. The ChatOllama clients, and with them the HTTP connections,
+    are created once per endpoint and model and then reused.
+    """
+    def __init__(self, endpoints=None, routes=None, keep_alive="30m"):
+        self.endpoints = endpoints or [Endpoint(DEFAULT_URL)]
+        self.routes = dict(DEFAULT_ROUTES, **(routes or {}))
+        self.keep_alive = keep_alive
+        self._backends = {}  # (url, model) -> OllamaBackend
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        OLLAMA_HOSTS="http://gpu1:11434=4,http://gpu2:11434=2"  (url=max concurrency)
+        OLLAMA_ROUTES="extract=gemma3:1b,chat=gemma3:4b"
+        """
+        endpoints = []
+        for spec in filter(None, os.environ.get("OLLAMA_HOSTS", "").split(",")):
+            url, _, limit = spec.strip().partition("=")
+            endpoints.append(Endpoint(url, int(limit or 2)))
+        routes = {}
+        for spec in filter(None, os.environ.get("OLLAMA_ROUTES", "").split(",")):
+            task, _, model = spec.strip().partition("=")
+            routes[task] = model
+        return cls(endpoints or None, routes)
+
+    def backend(self, endpoint, model):
+        key = (endpoint.url, model)
+        with self._lock:
+            if key not in self._backends:
+                self._backends[key] = OllamaBackend(model=model, base_url=endpoint.url, keep_alive=self.keep_alive)
+            return self._backends[key]
+
+    def pick(self):
+        """
+        The endpoint with the shortest queue; counts the caller as waiting there.
+        """
+        with self._lock:
+            endpoint = min(self.endpoints, key=lambda e: e.load)
+            with endpoint._lock:
+                endpoint.waiting += 1
+        return endpoint
+
+    def for_task(self, task, model=None, temperature=0.5, session=None, queue_timeout=None):
+        return PooledLLM(self, model or self.routes.get(task, self.routes["chat"]), temperature, task, session,
+                         queue_timeout)
+
+    def start(self):
+        """
+        Warm up and keep alive every model in use on every endpoint.
+        """
+        for model in set(self.routes.values()):
+            for endpoint in self.endpoints:
+                self.backend(endpoint, model).start()
+        return self
+
+    def health(self):
+        return {
+            f"{url} {model}": backend.health()
+            for (url, model), backend in list(self._backends.items())
+        }
+
+    def status(self):
+        """
+        For the /health endpoint: ready once every backend answers with its
+        model loaded, plus the backends' health and the endpoints' load.
+        """
+        backends = self.health()
+        return {
+            "ready": bool(backends) and all(b["ready"] for b in backends.values()),
+            "backends": backends,
+            "endpoints": self.stats(),
+        }
+
+    def stats(self):
+        return [
+            {"url": e.url, "in_flight": e.in_flight, "waiting": e.waiting, "max_concurrency": e.max_concurrency}
+            for e in self.endpoints
+        ]
+
+
+class PooledLLM:
+    """
+    Stands in for a ChatOllama client but sends every call through the pool.
+    Every call is traced as stage "llm.<task>" (see metrics.py), with its
+    queue wait and token counts, for session if given.
+
+    invoke() and stream() take an extra job=: while they wait for a slot they
+    give up with JobCancelled once it is cancelled, and with TimeoutError
+    after queue_timeout seconds. The async calls are cancelled with their task.
+    """
+    def __init__(self, pool, model, temperature=0.5, task="chat", session=None, queue_timeout=None):
+        self.pool = pool
+        self.model = model
+        self.temperature = temperature
+        self.task = task
+        self.session = session
+        self.queue_timeout = queue_timeout
+        self.last_queue_wait = 0.0  # seconds the last call waited for a free slot
+
+    def _client(self, endpoint):
+        return self.pool.backend(endpoint, self.model).client(self.temperature)
+
+    def _trace(self):
+        return trace(f"llm.{self.task}", self.session, model=self.model)
+
+    def _acquire(self, span, job=None):
+        endpoint = self.pool.pick()
+        started = time.perf_counter()
+        endpoint.acquire(self.queue_timeout, job)
+        self.last_queue_wait = span["queue_wait"] = time.perf_counter() - started
+        return endpoint
+
+    async def _aacquire(self, span):
+        endpoint = self.pool.pick()
+        started = time.perf_counter()
+        await endpoint.aacquire()
+        self.last_queue_wait = span["queue_wait"] = time.perf_counter() - started
+        return endpoint
+
+    @staticmethod
+    def _count(span, response):
+        prompt, completion = usage(response)
+        span.add("prompt_tokens", prompt)
+        span.add("completion_tokens", completion)
+        return response
+
+    def invoke(self, messages, job=None, **kwargs):
+        with self._trace() as span:
+            endpoint = self._acquire(span, job)
+            try:
+                return self._count(span, self._client(endpoint).invoke(messages, **kwargs))
+            finally:
+                endpoint.release()
+
+    async def ainvoke(self, messages, **kwargs):
+        with self._trace() as span:
+            endpoint = await self._aacquire(span)
+            try:
+                return self._count(span, await self._client(endpoint).ainvoke(messages, **kwargs))
+            finally:
+                endpoint.release()
+
+    def stream(self, messages, job=None, **kwargs):
+        with self._trace() as span:
+            endpoint = self._acquire(span, job)
+            try:
+                for chunk in self._client(endpoint).stream(messages, **kwargs):
+                    yield self._count(span, chunk)  # only the last chunk carries the usage
+            finally:
+                endpoint.release()
+
+    async def astream(self, messages, **kwargs):
+        with self._trace() as span:
+            endpoint = await self._aacquire(span)
+            try:
+                async for chunk in self._client(endpoint).astream(messages, **kwargs):
+                    yield self._count(span, chunk)
+            finally:
+                endpoint.release()
@@ -3,10 +3,38 @@ from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from datetime import datetime
 import wikipedia
 from flashcard_extractor import FlashcardExtractor
+from extraction_cache import ExtractionCache
+from wiki_utils import search_wiki, fetch_wiki_page, fetch_wiki_pages
+from conversation import ConversationContext
+from article_index import ArticleIndex
+from feedback import FeedbackTracker
+from topic_pool import TopicPool, FALLBACK_TOPICS
+from llm_pool import LLMPool, PooledLLM
+from vocab_store import VocabStore
+from vocab_deck import VocabDeck
+from lessons import LessonLibrary
+from review_scheduler import ReviewScheduler
+from jobs import Jobs, JobCancelled, REQUEST_TIMEOUT
+import logging
+import time
+from metrics import trace, in_session
 
-llm = ChatOllama(model="gemma3:4b", temperature=0.5)
+log = logging.getLogger(__name__)
 
-def random_topics():
+# All LLM clients of the process; configure endpoints and per-task models with
+# OLLAMA_HOSTS / OLLAMA_ROUTES. Call pool.start() at startup to preload the models.
+pool = LLMPool.from_env()
+llm = pool.for_task("topics")
+extraction_cache = ExtractionCache()  # shared by all teachers in this process
+vocab_store = VocabStore()  # every learner's cards, merged across articles and sessions
+lessons = LessonLibrary()  # lessons built ahead of time by precompute.py
+reviews = ReviewScheduler()  # spaced-repetition schedule of every learner's kept cards
+
+def generate_topics():
+    """
+    Ask the LLM for 10 new topics. This is a cold, slow call; the UI gets its
+    topics from topic_pool instead.
+    """
     system = f"""You are a helpful assistant that provides a list of random topics that will be used as search terms on wikipedia to generate learning content for an advanced Swedish adult student. Keep them rather general as there will be several results combined in the lesson.
     
     She is rather smart so keep the topics interesting. Current date is {datetime.now().strftime('%Y-%m-%d')}. 
@@ -23,34 +51,169 @@ def random_topics():
         SystemMessage(content=system),
         HumanMessage(content="Provide a list of 10 random topics.")
     ])
-    try:
-        return ["Välj ett ämne"] + [t.strip() for t in response.content.split(",")] + ["Other"]
-    except Exception:
-        return ["AI i samhället", "Svensk folktro", "Rymdfart", "Kvantfysik", "Vikingatiden"]
+    return [t.strip() for t in response.content.split(",") if t.strip()]
+
+
+def random_topics():
+    with trace("topics") as span:
+        try:
+            return ["Välj ett ämne"] + generate_topics() + ["Other"]
+        except Exception as e:
+            span["fallback"] = type(e).__name__
+            return list(FALLBACK_TOPICS)
+
+
+topic_pool = TopicPool(generate_topics)  # pre-generated topics for the UI, refilled in the background
 
 
 class AITeacher:
-    def __init__(self, model="gemma3:4b", temperature=0.5):
-        self.llm = ChatOllama(model=model, temperature=temperature)
-        self.vocab = []
+    def __init__(self, model=None, temperature=0.5, max_concurrency=4, chunk_tokens=None,
+                 cache=extraction_cache, llm=None, context_tokens=3000, retrieval_k=3, embedder=None,
+                 store=vocab_store, learner="default", skip_known=False, library=lessons, session=None,
+                 reviews=reviews, request_timeout=REQUEST_TIMEOUT, anonymous=False):
+        # By default every task gets the model routed to it by the shared pool;
+        # model pins all tasks to one model, llm replaces the pool altogether.
+        def client(task):
+            return llm or pool.for_task(task, model, temperature, session)
+
+        self.session = session  # id that metrics and traces of this teacher are recorded under
+
+        self.llm = client("chat")
+        self.extract_llm = client("extract")
+        self.cache = cache
+        self.store = store
+        self.learner = learner
+        self.anonymous = anonymous  # nobody can come back to this learner, close() deletes their cards and reviews
+        self.skip_known = skip_known  # leave out terms the learner already has in the store
+        self.library = library  # precomputed lessons, None to always fetch and extract live
+        self.reviews = reviews  # cards the learner keeps are reviewed from here, per learner
+        self.max_concurrency = max_concurrency  # parallel LLM calls during vocabulary extraction
+        self.chunk_tokens = chunk_tokens  # pack several sentences per extraction request (see FlashcardExtractor)
+        self.request_timeout = request_timeout  # seconds per extraction request, None for no limit
+        self.vocab = VocabDeck()
+        self.vocab_ready = False  # True once the vocabulary of the current article is complete
         self.message_history = []
+        self.feedback_tracker = FeedbackTracker(client("feedback"))  # evaluates each message in the background
+        # Keeps each chat prompt within context_tokens, see ConversationContext
+        self.context = ConversationContext(client("summary"), self.message_history, budget_tokens=context_tokens,
+                                           article_tokens=context_tokens * 2 // 5)
         self.article = ""  # Store the article text for processing
+        self.retrieval_k = retrieval_k  # article chunks per chat turn, None/0 sends the (trimmed) article
+        self.embedder = embedder  # None = local HashingEmbedder
+        self.article_index = None
+        # The running fetch/extraction/chat/feedback of this session; a new
+        # one cancels the old (a new article also stops the old extraction)
+        self.jobs = Jobs()
     
     def get_vocab(self):
         return self.vocab
 
+    def close(self):
+        # The session is gone: stop its work and drop its pending LLM requests,
+        # and the learner's state kept in memory (all of it if anonymous)
+        self.jobs.cancel_all()
+        if self.store is not None:
+            self.store.forget(self.learner, delete=self.anonymous)
+        if self.reviews is not None:
+            self.reviews.forget(self.learner, delete=self.anonymous)
 
-    def process_article(self):
-        extr = FlashcardExtractor(self.llm, self.article)
-        extr.extract_vocab_entries()
-        self.vocab = extr.vocab_entries
-        print("Processing finished. Vocabulary extracted:")
-    
-    
-    def diskussion(self, message, text):
+
+    def _extractor(self, job=None):
+        known = self.store.known_terms(self.learner) if self.store is not None and self.skip_known else None
+        return FlashcardExtractor(self.extract_llm, self.article, max_concurrency=self.max_concurrency,
+                                  chunk_tokens=self.chunk_tokens, cache=self.cache, known_terms=known, job=job,
+                                  request_timeout=self.request_timeout)
+
+    def _save_vocab(self):
+        if self.store is not None:
+            new = self.store.add(self.vocab, self.learner)
+            log.info("%d new terms saved to the vocabulary store", new)
+
+    @staticmethod
+    def _extract_fields(extr, span):
+        # What the extraction of one article did, as fields of its trace span
+        stats = extr.stats
+        span.update({k: stats[k] for k in ("sentences", "skipped", "requests", "recovered", "retries", "failed")})
+        span.update(cache_hits=stats["cached"], cache_misses=stats["sentences"] - stats["skipped"] - stats["cached"],
+                    parse_failures=stats["parse_failures"], cards=len(extr.vocab_entries))
+
+    def _finish_vocab(self, job, deck):
+        # Only the current extraction may set the deck; a superseded one
+        # belongs to an article the learner has already left
+        if self.jobs.is_current(job):
+            self.vocab = deck
+            self.vocab_ready = True
+            self._save_vocab()
+
+    def process_article(self, progress=None):
+        job = self.jobs.start("extract")
+        with trace("lesson.extract", self.session) as span:
+            extr = self._extractor(job)
+            try:
+                extr.extract_vocab_entries(progress=progress)
+            except JobCancelled as e:
+                span["cancelled"] = job.reason
+                log.info("Extraction stopped: %s", e)
+                return
+            finally:
+                self._extract_fields(extr, span)
+            self._finish_vocab(job, VocabDeck(extr.vocab_entries))
+
+    def stream_vocab(self):
         """
-        This method is a placeholder for any discussion or additional processing
-        that might be needed after the vocabulary extraction.
+        Generator that extracts the vocabulary of the current article and
+        yields the growing deck after every new card.
+        """
+        if self.vocab_ready:
+            yield self.vocab
+            return
+
+        job = self.jobs.start("extract")
+        # Cards go into this deck, not self.vocab: once superseded, this
+        # generator must not touch the deck of the next article
+        deck = self.vocab = VocabDeck()
+        finished = False
+        with trace("lesson.extract", self.session) as span:
+            extr = self._extractor(job)
+            try:
+                for entry in extr.iter_vocab_entries():
+                    deck.append(entry)
+                    yield deck  # the UI only renders the visible page, no copy needed
+                finished = True
+            except JobCancelled as e:
+                span["cancelled"] = job.reason
+                log.info("Extraction stopped: %s", e)
+                return
+            finally:
+                if not finished:
+                    job.cancel("closed")  # the caller stopped reading, drop the requests still pending
+                self._extract_fields(extr, span)
+
+            deck = VocabDeck(extr.vocab_entries)  # article order
+            self._finish_vocab(job, deck)
+        yield deck
+
+    def _index_for(self, text):
+        # Normally built when the article is loaded; rebuilt if diskussion gets another text
+        if self.article_index is None or self.article_index.text != text:
+            self.article_index = ArticleIndex(text, self.embedder)
+        return self.article_index
+
+    def _set_article(self, text):
+        self.article = text  # Store the article text for later use
+        self.vocab = VocabDeck()
+        self.vocab_ready = False  # extracted later through stream_vocab()/process_article()
+        if self.retrieval_k:
+            self.article_index = ArticleIndex(text, self.embedder)
+
+    @staticmethod
+    def _turn_fields(stats):
+        # The tokens are already counted by the llm.chat span
+        return {k: v for k, v in stats.items() if not k.endswith("_tokens") and k != "seconds"}
+
+    def _chat_messages(self, message, text):
+        """
+        Add the learner's message to the history and build the prompt for this turn.
         """
         system = f"""You are a teacher who helps a Swedish learner at B2/C1 level to discuss articles and help her 
         practice her Swedish.
@@ -59,52 +222,146 @@ class AITeacher:
         Do not provide any explanations or summaries, just ask questions and help her practice her Swedish."""
 
         self.message_history.append(HumanMessage(content=message))
+        self.feedback_tracker.sync(self.message_history)  # start evaluating it right away
+
+        if self.retrieval_k:
+            # Only send the chunks relevant to this turn, not the whole article
+            last_reply = self.message_history[-2].content if len(self.message_history) > 1 else ""
+            text = self._index_for(text).context_for(f"{last_reply}\n{message}", self.retrieval_k)
 
-        response = self.llm.invoke(
-            [SystemMessage(content=system), HumanMessage(content=f"Here is the text to discuss: {text}")]
-            + self.message_history
-        )
+        return self.context.build(system, text)
+
+    def diskussion(self, message, text):
+        """
+        This method is a placeholder for any discussion or additional processing
+        that might be needed after the vocabulary extraction.
+        """
+        with trace("lesson.chat", self.session) as span:
+            messages = self._chat_messages(message, text)
+            started = time.perf_counter()
+            response = self.llm.invoke(messages)
+            span.update(self._turn_fields(self.context.record(messages, response, started)))
 
         self.message_history.append(AIMessage(content=response.content.strip()))
         
         return response.content.strip() if response.content else "No response from AI teacher."
+
+    def stream_diskussion(self, message, text):
+        """
+        Streaming version of diskussion: yields the answer so far after every
+        token. The finished answer is added to message_history once, also when
+        the caller stops reading early, but not when a newer message has
+        superseded it: that message is in the history already, and the old
+        answer after it would scramble the turns.
+        """
+        job = self.jobs.start("chat")
+        with trace("lesson.chat", self.session) as span:
+            messages = self._chat_messages(message, text)
+            started = time.perf_counter()
+            response = None
+            # A pooled client also stops waiting for a slot when the job is cancelled
+            kwargs = {"job": job} if isinstance(self.llm, PooledLLM) else {}
+            try:
+                for chunk in self.llm.stream(messages, **kwargs):
+                    job.check()  # closing the stream aborts the request
+                    response = chunk if response is None else response + chunk
+                    yield response.content
+            except JobCancelled as e:
+                span["cancelled"] = job.reason
+                log.info("Answer stopped: %s", e)
+            finally:
+                answer = response.content.strip() if response is not None else ""
+                if response is not None:
+                    span.update(self._turn_fields(self.context.record(messages, response, started)))
+                superseded = job.cancelled and job.reason == "superseded"
+                if not superseded:
+                    self.message_history.append(AIMessage(content=answer))
+        if not answer and not superseded:
+            yield "No response from AI teacher."
     
     def feedback(self):
-        fdbck = ""
-        for m in self.message_history:
-            if m.type == "human":
-
-                fdbck += self.llm.invoke("Please provide feedback on the following message in terms of how correct it is: " + m.content).content
-                fdbck += "\n\n***********\n\n"
+        # The tracker has been evaluating messages since they were sent, so
+        # this normally only waits for the latest one
+        job = self.jobs.start("feedback")
+        with trace("lesson.feedback", self.session) as span:
+            self.feedback_tracker.sync(self.message_history)
+            fdbck = ""
+            try:
+                for text in self.feedback_tracker.iter_feedback(job):
+                    fdbck += text
+                    fdbck += "\n\n***********\n\n"
+            except JobCancelled:
+                span["cancelled"] = job.reason
+                fdbck += self._feedback_stopped(job)
 
         return fdbck
 
+    def stream_feedback(self):
+        """
+        Yields the feedback text so far, one message at a time as the
+        background evaluations complete.
+        """
+        job = self.jobs.start("feedback")
+        with trace("lesson.feedback", self.session) as span:
+            self.feedback_tracker.sync(self.message_history)
+            fdbck = ""
+            try:
+                for text in self.feedback_tracker.iter_feedback(job):
+                    fdbck += text + "\n\n***********\n\n"
+                    yield fdbck
+            except JobCancelled:
+                span["cancelled"] = job.reason
+                yield fdbck + self._feedback_stopped(job)
+
+    @staticmethod
+    def _feedback_stopped(job):
+        return "⚠️ Återkopplingen tog för lång tid, försök igen om en stund." if job.reason == "timeout" else ""
+
 
     def search_wiki(self,topic):
-        wikipedia.set_lang("sv")
-        try:
-            search_results = wikipedia.search(topic)
-            return search_results
-        except wikipedia.exceptions.DisambiguationError as e:
-            search_results = f"⚠️ Ämnet '{topic}' har flera betydelser. Välj ett mer specifikt ämne.\nFörslag: {', '.join(e.options[:5])}"
-        except wikipedia.exceptions.PageError:
-            search_results = f"⚠️ Ingen artikel hittades för '{topic}'."
-        return search_results
+        # Goes through the shared Wikipedia cache in wiki_utils
+        with in_session(self.session):
+            return search_wiki(topic)
 
 
     def fetch_wiki_article(self,topic):
-        wikipedia.set_lang("sv")
+        job = self.jobs.start("fetch")
         try:
-            page = wikipedia.page(topic)
-            self.article = page.content  # Store the article text for later use
-            self.process_article()
-            return page.html()
+            with in_session(self.session):
+                page = fetch_wiki_page(topic)
+            if self.jobs.is_current(job):  # a newer fetch has the article by now
+                self._set_article(page["content"])
+            return page["html"]
         except wikipedia.exceptions.DisambiguationError as e:
             return f"⚠️ Ämnet '{topic}' har flera betydelser. Välj ett mer specifikt ämne.\nFörslag: {', '.join(e.options[:5])}"
         except wikipedia.exceptions.PageError:
             return f"⚠️ Ingen artikel hittades för '{topic}'."
-    
-
-
 
+    def fetch_wiki_articles(self, titles):
+        """
+        Fetch all selected articles in one go (see wiki_utils.fetch_wiki_pages).
+        The texts are joined into self.article; returns the joined HTML, with
+        an error message in place of any page that could not be fetched.
+        Precomputed lessons are loaded from the library instead; when all
+        titles have one, their vocabulary is ready without any LLM call.
+        """
+        titles = list(titles)
+        job = self.jobs.start("fetch")  # also stops the extraction of the previous article
+        with trace("lesson.fetch", self.session, titles=len(titles)) as span, in_session(self.session):
+            bundles = {t: self.library.load(t) for t in titles} if self.library is not None else {}
+            missing = [t for t in titles if not bundles.get(t)]
+            span["precomputed"] = len(titles) - len(missing)
+            pages = fetch_wiki_pages(missing) if missing else {}
+            pages.update({t: bundles[t].page() for t in titles if bundles.get(t)})
+            pages = {t: pages[t] for t in titles if t in pages}
+            html = "\n".join(p["html"] if isinstance(p, dict) else f"<p>{p}</p>" for p in pages.values())
+            if not self.jobs.is_current(job):
+                span["cancelled"] = job.reason  # superseded, the newer selection keeps its article
+                return html
 
+            self._set_article("\n\n".join(p["content"] for p in pages.values() if isinstance(p, dict)))
+            if titles and not missing:
+                self.vocab = bundles[titles[0]].vocab if len(titles) == 1 else \
+                    VocabDeck(card for t in titles for card in bundles[t].vocab)
+                self.vocab_ready = True
+        return html
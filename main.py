@@ -1,11 +1,18 @@
-import gradio as gr
-from llm_utils import random_topics
-from wiki_utils import search_wiki, fetch_wiki_article
-from llm_utils import AITeacher
+import time
+started = time.perf_counter()  # startup time, reported before launch
 
-ai = AITeacher(model="gemma3:4b", temperature=0.5)
+import gradio as gr
+from llm_utils import topic_pool
+from wiki_utils import search_wiki
+from llm_utils import AITeacher, pool
+from session_manager import SessionManager
+import metrics
 
-global article_text
+# One teacher per browser session; they all share the LLM pool and the caches
+# and each learner (login or session) gets their own cards and review queue
+sessions = SessionManager(lambda sid, learner: AITeacher(session=sid, learner=learner,
+                                                        anonymous=SessionManager.anonymous(learner)),
+                          max_sessions=50, idle_timeout=30 * 60, on_drop=AITeacher.close)
 
 
 
@@ -45,14 +52,26 @@ def on_continue_and_search(dropdown_value, custom_value):
         gr.update(choices=titles, value=[], visible=True)  # article_choices
     )
 
-def chat_ai(history, message):
-    # history: list of (user, ai) tuples, message: latest user message
-    global article_text
-    ai_reply = ai.diskussion(history, article_text)
-    return ai_reply
+def chat_ai(message, history, request: gr.Request):
+    # message: latest user message, history: earlier turns (kept by the teacher instead)
+    # Generator: the ChatInterface shows the answer while it is being written
+    ai = sessions.get(request)
+    yield from ai.stream_diskussion(message, ai.article)
+
+def on_extract(selected_articles, request: gr.Request):
+    # Text and HTML for the whole selection in one bulk fetch
+    ai = sessions.get(request)
+    html = ai.fetch_wiki_articles(selected_articles or [])
+    return gr.update(value=html, visible=True)
+
+def give_feedback(request: gr.Request):
+    yield from sessions.get(request).stream_feedback()
 
-def give_feedback():
-    return ai.feedback()
+def process_vocab(request: gr.Request):
+    sessions.get(request).process_article()
+
+def end_session(request: gr.Request):
+    sessions.drop(request)
 
 with gr.Blocks() as demo:
     gr.Markdown("## 🇸🇪 Svenskaövningar")
@@ -61,7 +80,8 @@ with gr.Blocks() as demo:
     topic_state = gr.State("")
 
     # 2) first-phase controls
-    topic_dropdown   = gr.Dropdown(choices=random_topics() + ["Other"], label="Välj ett ämne")
+    # Topics come from the pre-generated pool; no LLM call while building the UI
+    topic_dropdown   = gr.Dropdown(choices=topic_pool.choices(), label="Välj ett ämne")
     next_step_msg    = gr.Textbox(visible=False, interactive=False)
     custom_topic_box = gr.Textbox(label="Ange eget ämne", visible=False)
     continue_button  = gr.Button("Gå vidare", visible=False)
@@ -79,7 +99,7 @@ with gr.Blocks() as demo:
         inputs=[custom_topic_box],
         outputs=[next_step_msg, continue_button]
     )
-"""
+    """
     # 3) second-phase row (single block)
     with gr.Row(visible=False) as phase_two:
         article_choices = gr.CheckboxGroup(label="Välj artiklar att läsa", visible=False, interactive=True)
@@ -108,7 +128,7 @@ with gr.Blocks() as demo:
         outputs=gr.HTML(label="Hämtade artiklar")
     )"""
 
-   with gr.Row(visible=False) as phase_two:
+    with gr.Row(visible=False) as phase_two:
         article_choices = gr.CheckboxGroup(label="Välj artiklar", choices=[])
         extract_button  = gr.Button("Hämta artiklar")
     
@@ -118,7 +138,7 @@ with gr.Blocks() as demo:
         extract_button.click(
             fn=on_extract,
             inputs=[article_choices],
-            outputs=[articles_html, articles_html]
+            outputs=[articles_html]
         )
 
 
@@ -130,7 +150,7 @@ with gr.Blocks() as demo:
     vocab_button = gr.Button("Visa ordförråd")
     vocab_output = gr.Textbox(label="Ordförråd", visible=False, interactive=False)
     vocab_button.click(
-        fn=lambda: ai.process_article(),
+        fn=process_vocab,
         inputs=[],
         outputs=[vocab_output]
     )
@@ -157,4 +177,13 @@ with gr.Blocks() as demo:
         outputs=[feedback_output]
     )
     
+    # Fresh topics from the pool for every page load
+    demo.load(lambda: gr.update(choices=topic_pool.choices()), outputs=[topic_dropdown])
+
+    # Free the session's teacher when the tab is closed
+    demo.unload(end_session)
+
+print(f"UI ready in {time.perf_counter() - started:.2f} s")
+metrics.setup(health=pool.status)  # logging, trace log, /metrics and /health endpoints
+pool.start()  # load the models in the background and keep them resident
 demo.launch()
@@ -0,0 +1,247 @@
+"""
+Tracing and metrics for the lesson pipeline.
+
+Every LLM call (through llm_pool), every Wikipedia call and every lesson
+stage runs inside trace(stage), which records its wall time and whatever the
+stage adds to its span (queue wait, prompt/completion tokens, cache hits,
+parse failures). The results end up in three places:
+
+- counters and histograms per stage, served in Prometheus text format by
+  serve() on http://127.0.0.1:METRICS_PORT/metrics
+- totals per stage and session, as JSON on /sessions (and session_stats())
+- the state of the LLM backends as JSON on /health, when setup() gets a
+  health callable (503 while they are not ready)
+- one JSON line per span in the trace log (TRACE_LOG, default cache/trace.jsonl)
+
+Call setup() once at startup to configure logging and start the endpoint.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRACE_LOG = os.environ.get("TRACE_LOG", os.path.join("cache", "trace.jsonl"))
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))  # 0 = no endpoint
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+MAX_SESSIONS = 1000  # per-session totals kept for the most recent sessions only
+
+# Session of the current call; set by AITeacher around its work (see in_session),
+# spans pick it up unless they are given one explicitly
+session = contextvars.ContextVar("session", default=None)
+
+trace_log = logging.getLogger("trace")
+log = logging.getLogger(__name__)
+
+# Span fields that are summed up per stage (and per session)
+TOTALS = ("queue_wait", "prompt_tokens", "completion_tokens", "cache_hits", "cache_misses", "parse_failures")
+
+
+class Metrics:
+    """
+    Thread-safe counters and histograms, keyed by metric name and labels.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+        self.sessions = OrderedDict()  # session -> stage -> totals
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self.histograms.setdefault(key, [[0] * len(BUCKETS), 0.0, 0])
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def record_session(self, sid, stage, seconds, fields):
+        with self._lock:
+            stages = self.sessions.setdefault(sid, {})
+            self.sessions.move_to_end(sid)
+            while len(self.sessions) > MAX_SESSIONS:
+                self.sessions.popitem(last=False)
+            totals = stages.setdefault(stage, dict({"calls": 0, "seconds": 0.0, "errors": 0}, **{k: 0 for k in TOTALS}))
+            totals["calls"] += 1
+            totals["seconds"] += seconds
+            totals["errors"] += "error" in fields
+            for k in TOTALS:
+                totals[k] += fields.get(k) or 0
+
+    def session_stats(self, sid):
+        with self._lock:
+            return json.loads(json.dumps(self.sessions.get(sid, {})))
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}" if items else ""
+
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{fmt(labels)} {value:g}")
+        for (name, labels), (buckets, total, count) in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, n in zip(BUCKETS, buckets):
+                lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {n}")
+            lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{fmt(labels)} {total:g}")
+            lines.append(f"{name}_count{fmt(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class Span(dict):
+    """
+    The fields of one traced call; stages add to them while they run.
+    """
+    def add(self, key, value=1):
+        self[key] = self.get(key, 0) + value
+
+
+def record(stage, seconds, sid=None, **fields):
+    """
+    Record a finished stage: metrics, per-session totals and a trace log line.
+    """
+    sid = sid or session.get() or "-"
+    metrics.observe("teacher_stage_seconds", seconds, stage=stage)
+    if "error" in fields:
+        metrics.inc("teacher_stage_errors_total", stage=stage)
+    if fields.get("cancelled"):
+        metrics.inc("teacher_stage_cancelled_total", stage=stage)
+    if fields.get("queue_wait"):
+        metrics.inc("teacher_queue_wait_seconds_total", fields["queue_wait"], stage=stage)
+    for kind in ("prompt", "completion"):
+        if fields.get(f"{kind}_tokens"):
+            metrics.inc("teacher_llm_tokens_total", fields[f"{kind}_tokens"], stage=stage, kind=kind)
+    for key in ("cache_hits", "cache_misses", "parse_failures"):
+        if fields.get(key):
+            metrics.inc(f"teacher_{key}_total", fields[key], stage=stage)
+    metrics.record_session(sid, stage, seconds, fields)
+    if trace_log.isEnabledFor(logging.INFO):
+        trace_log.info(json.dumps(dict({"ts": round(time.time(), 3), "stage": stage, "session": sid,
+                                        "seconds": round(seconds, 4)}, **fields),
+                                  ensure_ascii=False, default=str))
+
+
+@contextmanager
+def trace(stage, sid=None, **fields):
+    """
+    Time the block as stage; yields a Span the block can add fields to.
+    """
+    span = Span(fields)
+    started = time.perf_counter()
+    try:
+        yield span
+    except (GeneratorExit, asyncio.CancelledError):
+        span["cancelled"] = True  # abandoned stream or cancelled task, not a failure
+        raise
+    except BaseException as e:
+        span["error"] = type(e).__name__
+        raise
+    finally:
+        record(stage, time.perf_counter() - started, sid, **span)
+
+
+@contextmanager
+def in_session(sid):
+    # Attribute everything traced in this block (in this thread) to session sid
+    token = session.set(sid)
+    try:
+        yield
+    finally:
+        session.reset(token)
+
+
+def usage(response):
+    """
+    (prompt tokens, completion tokens) of an LLM response, 0 when not reported.
+    """
+    data = getattr(response, "usage_metadata", None) or {}
+    return data.get("input_tokens") or 0, data.get("output_tokens") or 0
+
+
+def serve(port=METRICS_PORT, host="127.0.0.1", health=None):
+    """
+    Serve /metrics (Prometheus), /sessions (JSON) and, given a health callable
+    that returns a dict with a "ready" flag, /health (JSON) on a background
+    thread.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status = 200
+            if self.path == "/metrics":
+                body, kind = metrics.render().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/sessions":
+                with metrics._lock:
+                    body = json.dumps(metrics.sessions, ensure_ascii=False).encode("utf-8")
+                kind = "application/json"
+            elif self.path == "/health" and health is not None:
+                try:
+                    report = health()
+                except Exception as e:
+                    report = {"ready": False, "error": str(e)}
+                body, kind = json.dumps(report, ensure_ascii=False).encode("utf-8"), "application/json"
+                status = 200 if report.get("ready") else 503
+            else:
+                self.send_error(404)
+                return
+            self.send_response(status)
+            self.send_header("Content-Type", kind)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.info("Metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+
+def setup(port=METRICS_PORT, trace_path=TRACE_LOG, level=os.environ.get("LOG_LEVEL", "INFO"), health=None):
+    """
+    Console logging for the app, the JSON trace log and the metrics endpoint
+    (with /health if health is given, see serve()).
+    """
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if trace_path:
+        if os.path.dirname(trace_path):
+            os.makedirs(os.path.dirname(trace_path), exist_ok=True)
+        handler = logging.FileHandler(trace_path, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        trace_log.addHandler(handler)
+        trace_log.setLevel(logging.INFO)
+        trace_log.propagate = False  # spans go to the file, not the console
+    if port:
+        try:
+            return serve(port, health=health)
+        except OSError as e:
+            log.warning("Metrics endpoint not started: %s", e)
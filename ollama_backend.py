@@ -0,0 +1,170 @@
+"""
+Keeps the Ollama model loaded and tells us whether it is ready.
+
+    python ollama_backend.py      # health/readiness probe, exit code 0 when ready
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import requests
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_ollama import ChatOllama
+
+
+DEFAULT_URL = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+log = logging.getLogger(__name__)
+# Seconds an LLM request may take before it is given up; a cancelled job also
+# stops waiting for it (see jobs.py)
+REQUEST_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", "300"))
+COLD_LOAD_SECONDS = 0.5  # a request whose model load took longer than this counts as a cold start
+
+
+class LatencyRecorder(BaseCallbackHandler):
+    """
+    LangChain callback that times every chat call and splits the timings into
+    cold starts (Ollama had to load the model first) and warm calls.
+    """
+    def __init__(self):
+        self._started = {}
+        self._lock = threading.Lock()
+        self.cold = []
+        self.warm = []
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        info = {}
+        if response.generations and response.generations[0]:
+            generation = response.generations[0][0]
+            info = dict(generation.generation_info or {})
+            info.update(getattr(getattr(generation, "message", None), "response_metadata", None) or {})
+        load_seconds = (info.get("load_duration") or 0) / 1e9  # Ollama reports nanoseconds
+        with self._lock:
+            (self.cold if load_seconds > COLD_LOAD_SECONDS else self.warm).append(seconds)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+    def stats(self):
+        def summary(values):
+            return {"count": len(values), "mean_s": round(sum(values) / len(values), 3) if values else None}
+        with self._lock:
+            return {"cold": summary(self.cold), "warm": summary(self.warm)}
+
+
+class OllamaBackend:
+    """
+    One model on one Ollama server: hands out ChatOllama clients, loads the
+    model at startup, keeps it resident and answers health checks.
+    """
+    def __init__(self, model="gemma3:4b", base_url=DEFAULT_URL, keep_alive="30m", refresh_every=10 * 60):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.keep_alive = keep_alive
+        self.refresh_every = refresh_every  # seconds between keep-alive pings, must be below keep_alive
+        self.latency = LatencyRecorder()
+        self.warmup_seconds = None
+        self._clients = {}
+        self._keep_alive_thread = None
+
+    def client(self, temperature=0.5):
+        """
+        Shared ChatOllama client for this model; every call also renews keep_alive.
+        Inside an event loop the client is per loop: its async HTTP client is
+        tied to the loop it first ran in and fails once that loop is closed.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        key = (temperature, loop)
+        client = self._clients.get(key)
+        if client is None:
+            # Forget the clients of loops that are gone (every asyncio.run() makes a new one)
+            for old in [k for k in list(self._clients) if k[1] is not None and k[1].is_closed()]:
+                self._clients.pop(old, None)
+            client = ChatOllama(
+                model=self.model,
+                temperature=temperature,
+                base_url=self.base_url,
+                keep_alive=self.keep_alive,
+                callbacks=[self.latency],
+                client_kwargs={"timeout": REQUEST_TIMEOUT},
+            )
+        return self._clients.setdefault(key, client)
+
+    def _load(self):
+        # A generate request without a prompt only loads the model (and sets its keep_alive)
+        response = requests.post(
+            f"{self.base_url}/api/generate",
+            json={"model": self.model, "keep_alive": self.keep_alive},
+            timeout=300,
+        )
+        response.raise_for_status()
+
+    def warm_up(self):
+        started = time.perf_counter()
+        try:
+            self._load()
+        except Exception as e:
+            log.warning("Could not warm up %s: %s", self.model, e)
+            return None
+        self.warmup_seconds = time.perf_counter() - started
+        log.info("Model %s loaded in %.1f s", self.model, self.warmup_seconds)
+        return self.warmup_seconds
+
+    def start(self):
+        """
+        Warm up in the background and keep the model loaded from then on.
+        """
+        if self._keep_alive_thread is None:
+            self._keep_alive_thread = threading.Thread(target=self._keep_alive_loop, daemon=True)
+            self._keep_alive_thread.start()
+        return self
+
+    def _keep_alive_loop(self):
+        self.warm_up()
+        while True:
+            time.sleep(self.refresh_every)
+            try:
+                self._load()
+            except Exception as e:
+                log.warning("Keep-alive for %s failed: %s", self.model, e)
+
+    def health(self):
+        """
+        Whether the server answers and whether the model is loaded in memory.
+        """
+        started = time.perf_counter()
+        try:
+            response = requests.get(f"{self.base_url}/api/ps", timeout=5)
+            response.raise_for_status()
+            loaded = [m.get("name") for m in response.json().get("models", [])]
+        except Exception as e:
+            return {"reachable": False, "ready": False, "error": str(e)}
+        model_loaded = any(name == self.model or name.split(":")[0] == self.model for name in loaded)
+        return {
+            "reachable": True,
+            "ready": model_loaded,
+            "model": self.model,
+            "probe_seconds": round(time.perf_counter() - started, 3),
+            "warmup_seconds": self.warmup_seconds,
+            "latency": self.latency.stats(),
+        }
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    status = OllamaBackend(os.environ.get("OLLAMA_MODEL", "gemma3:4b")).health()
+    print(json.dumps(status, indent=2))
+    sys.exit(0 if status["ready"] else 1)
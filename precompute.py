@@ -0,0 +1,128 @@
+"""
+Build lessons ahead of time, without the UI.
+
+    python precompute.py "Vikingatiden" "Svensk folktro" --workers 4
+    python precompute.py --file topics.txt --per-topic 3
+    python precompute.py --titles "Birka" "Gamla Uppsala"
+
+Each topic is searched on Wikipedia, and every article found is fetched and
+its vocabulary extracted in a pool of worker processes. The results are
+written to a lesson library (see lessons.py) that the app loads instantly.
+Articles that already have a bundle are skipped, so an interrupted run picks
+up where it stopped.
+"""
+import argparse
+import multiprocessing
+import time
+
+from jobs import REQUEST_TIMEOUT
+from lessons import LessonLibrary, DEFAULT_PATH
+
+# Set per worker process by _init_worker
+_llm = None
+_cache = None
+_concurrency = 1
+_request_timeout = None
+
+
+def _init_worker(concurrency, request_timeout=None):
+    # Every worker gets its own clients and SQLite connections
+    global _llm, _cache, _concurrency, _request_timeout
+    from llm_pool import LLMPool
+    from extraction_cache import ExtractionCache
+    _llm = LLMPool.from_env().for_task("extract")
+    _cache = ExtractionCache()
+    _concurrency = concurrency
+    _request_timeout = request_timeout
+
+
+def search_topic(topic):
+    from wiki_utils import search_wiki
+    results = search_wiki(topic)
+    return topic, results if isinstance(results, list) else []
+
+
+def build_lesson(title):
+    """
+    Fetch and extract one article. Returns (title, page, entries, seconds),
+    or (title, error message, None, seconds) if it failed.
+    """
+    from wiki_utils import fetch_wiki_pages
+    from flashcard_extractor import FlashcardExtractor
+    start = time.perf_counter()
+    try:
+        page = fetch_wiki_pages([title])[title]  # same parsed HTML as the app's fetch_wiki_articles
+        if not isinstance(page, dict):
+            return title, page, None, time.perf_counter() - start
+        extr = FlashcardExtractor(_llm, page["content"], max_concurrency=_concurrency, cache=_cache,
+                                  request_timeout=_request_timeout)
+        entries = extr.extract_vocab_entries()
+    except Exception as e:  # one bad article shouldn't stop the batch
+        return title, f"{type(e).__name__}: {e}", None, time.perf_counter() - start
+    return title, page, entries, time.perf_counter() - start
+
+
+def precompute(items, library, workers=4, per_topic=3, titles=False, concurrency=2,
+               request_timeout=REQUEST_TIMEOUT):
+    """
+    Build a bundle for every article of items (topics, or titles if titles=True).
+    Returns the number of lessons written.
+    """
+    ctx = multiprocessing.get_context("spawn")  # no inherited SQLite connections or sockets
+    start = time.perf_counter()
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(concurrency, request_timeout)) as procs:
+        if titles:
+            wanted = list(items)
+        else:
+            wanted = []
+            for topic, results in procs.imap_unordered(search_topic, items):
+                print(f"{topic}: {results[:per_topic]}")
+                wanted += results[:per_topic]
+
+        todo = [t for t in dict.fromkeys(wanted) if not library.has(t)]
+        print(f"{len(wanted)} articles, {len(wanted) - len(todo)} already built, {len(todo)} to go")
+
+        done = failed = 0
+        for title, page, entries, seconds in procs.imap_unordered(build_lesson, todo):
+            if entries is None:
+                failed += 1
+                print(f"✗ {title}: {page}")
+                continue
+            library.save(title, page["content"], page["html"], entries)
+            done += 1
+            rate = done / (time.perf_counter() - start) * 60
+            print(f"✓ {title}: {len(entries)} cards in {seconds:.1f}s "
+                  f"[{done + failed}/{len(todo)}, {rate:.1f} articles/min]")
+
+    elapsed = time.perf_counter() - start
+    print(f"{done} lessons built, {failed} failed in {elapsed:.0f}s "
+          f"({done / elapsed * 60 if elapsed else 0:.1f} articles/min)")
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("items", nargs="*", help="topics to search for (or titles with --titles)")
+    parser.add_argument("--file", help="read topics/titles from a file, one per line")
+    parser.add_argument("--titles", action="store_true", help="items are article titles, skip the search")
+    parser.add_argument("--per-topic", type=int, default=3, help="articles to build per topic")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes")
+    parser.add_argument("--concurrency", type=int, default=2, help="parallel LLM calls per worker")
+    parser.add_argument("--request-timeout", type=float, default=REQUEST_TIMEOUT,
+                        help="seconds per extraction request (with --concurrency > 1), 0 for no limit")
+    parser.add_argument("--out", default=DEFAULT_PATH, help="lesson library directory")
+    args = parser.parse_args()
+
+    items = list(args.items)
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            items += [line.strip() for line in f if line.strip()]
+    if not items:
+        parser.error("no topics or titles given")
+
+    precompute(items, LessonLibrary(args.out), args.workers, args.per_topic, args.titles, args.concurrency,
+               args.request_timeout or None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Spaced repetition for the cards a learner keeps (SM-2).
+
+Every kept card gets a review state: ease factor, interval, repetitions and
+the time it is due next. After each review the learner grades how well they
+knew the card (0-5) and SM-2 works out when to show it again: a card that was
+known comes back after 1 day, then 6 days, then the previous interval times
+its ease; a card that was not known starts over and comes back in a few
+minutes.
+
+The states are stored in SQLite (REVIEW_DB, default cache/reviews.sqlite).
+For every learner that is used, a due-queue in memory orders the cards by due
+time, so the next card, the number of due cards and grading a card cost
+O(log n), also for decks of 100k+ cards (see benchmark.py reviews).
+"""
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from typing import Iterable, Optional
+
+from flashcard_extractor import VocabEntry, normalize_term
+
+
+DEFAULT_PATH = os.environ.get("REVIEW_DB", os.path.join("cache", "reviews.sqlite"))
+DAY = 24 * 60 * 60
+LAPSE_DELAY = 10 * 60  # seconds until a card that was not known is shown again
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+
+
+def sm2(ease, interval, repetitions, quality):
+    """
+    One SM-2 step. interval is in days, quality 0-5 (below 3 = not known).
+    Returns the new (ease, interval, repetitions).
+    """
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if quality < 3:
+        return ease, 0.0, 0
+    repetitions += 1
+    if repetitions == 1:
+        interval = 1.0
+    elif repetitions == 2:
+        interval = 6.0
+    else:
+        interval = round(interval * ease, 1)
+    return ease, interval, repetitions
+
+
+class DueQueue:
+    """
+    The cards of one learner ordered by due time.
+
+    Cards that are not due yet wait in one heap; as time passes they move to a
+    second heap of due cards, so counting the due cards is len() of a counter
+    instead of a scan. Rescheduling a card pushes a new heap entry and leaves
+    the old one behind; old entries are skipped when they surface and the
+    heaps are rebuilt once they are mostly old entries.
+    """
+    def __init__(self, due_times=None):
+        # key -> [due, seq, is_due]; seq tells the card's current heap entry from old ones
+        self.cards = {}
+        self._seq = 0
+        self._waiting = []  # (due, seq, key), not due yet
+        self._due = []  # (due, seq, key), due; the most overdue first
+        self._due_count = 0
+        for key, due in (due_times or {}).items():
+            self._seq += 1
+            self.cards[key] = [due, self._seq, False]
+            self._waiting.append((due, self._seq, key))
+        heapq.heapify(self._waiting)
+
+    def __len__(self):
+        return len(self.cards)
+
+    def _advance(self, now):
+        # Move the cards that have become due over to the due heap
+        waiting = self._waiting
+        while waiting and waiting[0][0] <= now:
+            entry = heapq.heappop(waiting)
+            state = self.cards.get(entry[2])
+            if state is not None and state[1] == entry[1]:
+                state[2] = True
+                heapq.heappush(self._due, entry)
+                self._due_count += 1
+
+    def schedule(self, key, due):
+        """
+        Add the card or move it to a new due time.
+        """
+        self.remove(key)
+        self._seq += 1
+        self.cards[key] = [due, self._seq, False]
+        heapq.heappush(self._waiting, (due, self._seq, key))
+        if len(self._waiting) + len(self._due) > 2 * len(self.cards) + 1024:
+            self._compact()
+
+    def remove(self, key):
+        state = self.cards.pop(key, None)
+        if state is not None and state[2]:
+            self._due_count -= 1
+
+    def due_count(self, now):
+        self._advance(now)
+        return self._due_count
+
+    def peek(self, now):
+        """
+        Key of the most overdue card, None when nothing is due.
+        """
+        self._advance(now)
+        due = self._due
+        while due:
+            _, seq, key = due[0]
+            state = self.cards.get(key)
+            if state is not None and state[1] == seq:
+                return key
+            heapq.heappop(due)  # an old entry of a rescheduled or removed card
+        return None
+
+    def _compact(self):
+        self._waiting = [(s[0], s[1], k) for k, s in self.cards.items() if not s[2]]
+        self._due = [(s[0], s[1], k) for k, s in self.cards.items() if s[2]]
+        heapq.heapify(self._waiting)
+        heapq.heapify(self._due)
+
+
+class ReviewScheduler:
+    """
+    Review states of every learner's kept cards, keyed on (learner, normalized term).
+    """
+    def __init__(self, path=DEFAULT_PATH):
+        self._lock = threading.Lock()
+        self._queues = {}  # learner -> DueQueue, loaded on first use
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS reviews (
+                learner TEXT NOT NULL,
+                key TEXT NOT NULL,
+                card TEXT NOT NULL,
+                ease REAL NOT NULL,
+                interval REAL NOT NULL,
+                repetitions INTEGER NOT NULL,
+                lapses INTEGER NOT NULL,
+                due REAL NOT NULL,
+                reviewed REAL,
+                PRIMARY KEY (learner, key)
+            )""")
+        self._db.commit()
+
+    def _queue(self, learner):
+        queue = self._queues.get(learner)
+        if queue is None:
+            rows = self._db.execute("SELECT key, due FROM reviews WHERE learner = ?", (learner,))
+            queue = self._queues[learner] = DueQueue(dict(rows))
+        return queue
+
+    def add(self, entries: Iterable[VocabEntry], learner="default", now=None) -> int:
+        """
+        Start reviewing cards (due right away). Cards the learner already
+        reviews keep their schedule. Returns the number of new cards.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            queue = self._queue(learner)
+            new = {}
+            for entry in entries:
+                key = normalize_term(entry.term)
+                if key and key not in queue.cards and key not in new:
+                    new[key] = entry
+            self._db.executemany(
+                "INSERT OR IGNORE INTO reviews VALUES (?, ?, ?, ?, 0, 0, 0, ?, NULL)",
+                ((learner, key, json.dumps(_fields(entry), ensure_ascii=False), DEFAULT_EASE, now)
+                 for key, entry in new.items()),
+            )
+            self._db.commit()
+            for key in new:
+                queue.schedule(key, now)
+        return len(new)
+
+    def due_count(self, learner="default", now=None) -> int:
+        with self._lock:
+            return self._queue(learner).due_count(time.time() if now is None else now)
+
+    def count(self, learner="default") -> int:
+        with self._lock:
+            return len(self._queue(learner))
+
+    def next_card(self, learner="default", now=None) -> Optional[VocabEntry]:
+        """
+        The most overdue card, or None when nothing is due.
+        """
+        with self._lock:
+            key = self._queue(learner).peek(time.time() if now is None else now)
+            if key is None:
+                return None
+            (card,) = self._db.execute(
+                "SELECT card FROM reviews WHERE learner = ? AND key = ?", (learner, key)
+            ).fetchone()
+        return VocabEntry(**json.loads(card))
+
+    def grade(self, term, quality, learner="default", now=None) -> float:
+        """
+        Record a review of term with quality 0 (no idea) to 5 (perfect).
+        Returns the time the card is due next.
+        """
+        if not 0 <= quality <= 5:
+            raise ValueError("quality must be between 0 and 5")
+        now = time.time() if now is None else now
+        key = normalize_term(term)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT ease, interval, repetitions, lapses FROM reviews WHERE learner = ? AND key = ?",
+                (learner, key),
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"{term!r} is not being reviewed")
+            ease, interval, repetitions, lapses = row
+            ease, interval, repetitions = sm2(ease, interval, repetitions, quality)
+            lapses += quality < 3
+            due = now + (interval * DAY if interval else LAPSE_DELAY)
+            self._db.execute(
+                "UPDATE reviews SET ease = ?, interval = ?, repetitions = ?, lapses = ?, due = ?, reviewed = ? "
+                "WHERE learner = ? AND key = ?",
+                (ease, interval, repetitions, lapses, due, now, learner, key),
+            )
+            self._db.commit()
+            self._queue(learner).schedule(key, due)
+        return due
+
+    def remove(self, term, learner="default"):
+        key = normalize_term(term)
+        with self._lock:
+            self._db.execute("DELETE FROM reviews WHERE learner = ? AND key = ?", (learner, key))
+            self._db.commit()
+            self._queue(learner).remove(key)
+
+    def forget(self, learner, delete=False):
+        """
+        Drop the learner's due-queue from memory (it is loaded again on next
+        use), and with delete=True their review states as well.
+        """
+        with self._lock:
+            self._queues.pop(learner, None)
+            if delete:
+                self._db.execute("DELETE FROM reviews WHERE learner = ?", (learner,))
+                self._db.commit()
+
+
+def _fields(entry):
+    # VocabEntry or a deck Card
+    return asdict(entry) if isinstance(entry, VocabEntry) else asdict(entry.entry())
@@ -0,0 +1,144 @@
+"""
+Swedish sentence splitting and a cheap check whether a sentence is worth an
+LLM call at all.
+"""
+import os
+import re
+
+
+# Abbreviations that end with a period but don't end a sentence
+ABBREVIATIONS = {
+    "t.ex.", "bl.a.", "m.m.", "mm.", "dvs.", "d.v.s.", "osv.", "o.s.v.", "ca.", "c:a", "s.k.", "f.d.",
+    "f.ö.", "t.o.m.", "m.fl.", "e.d.", "e.kr.", "f.kr.", "kap.", "nr.", "st.", "resp.", "jfr.", "fr.o.m.",
+    "p.g.a.", "pga.", "etc.", "kl.", "ung.", "sek.", "milj.", "mdr.", "tel.", "prof.", "dr.", "s.", "f.",
+    "d.", "b.", "jan.", "feb.", "aug.", "sept.", "okt.", "nov.", "dec.", "tr.", "uppl.", "övers.", "red.",
+}
+
+# The most common Swedish words (with frequent inflections). Sentences made up
+# of only these give no useful cards for a B2/C1 learner.
+BASIC_WORDS = set("""
+och i att det som en på är av för med till den har de inte om ett han men var jag sig från vi så
+kan man när år säger hon under också efter eller nu sin där vid mot ska skulle kommer ut får finns
+vara bara blir vad alla andra då två mycket många hade in här detta utan varit sedan upp sina
+genom nya denna dessa över honom henne oss dem mig dig din ditt dina min mitt mina vår vårt våra
+er ert era deras hans hennes dess deras vilken vilket vilka någon något några ingen inget inga
+annan annat samma själv hela helt mer mest mindre minst stor stort stora större störst liten litet
+små mindre lite ny nytt nyare gammal gammalt gamla äldre första andra tredje sista senaste nästa
+god gott goda bra bättre bäst dålig dåligt sämre lång långt långa kort hög högt höga låg lågt
+dag dagen dagar år året åren tid tiden gång gången gånger sätt sättet del delen delar sida sidan
+land landet länder stad staden städer världen människor människa person personer barn barnen
+man mannen män kvinna kvinnor namn namnet plats platsen hus huset vatten vägen väg arbete
+få fick fått göra gör gjorde gjort ha hade haft bli blev blivit ta tar tog tagit ge ger gav
+gett gå går gick gått komma kom kommit se ser såg sett säga sa sade sagt vilja vill ville
+kunna kunde kunnat skola måste borde heta heter hette veta vet visste tycka tycker tyckte
+finnas fanns ligga ligger låg stå står stod sitta sitter satt bo bor bodde leva lever levde
+använda används använder användes användas använt kallas kallades kallad fanns började börjar
+bland mellan kring runt utom inom hos bakom framför bredvid innan före sen senare tidigare
+redan ännu alltid aldrig ofta ibland igen tillbaka bort hem hemma kvar även dock ändå alltså
+därför eftersom medan fast trots om än än både varken antingen sådan sådant sådana ju väl nog
+hur varför vem vems var vart vilken när här där hit dit nej ja inte icke samt enligt cirka
+ett två tre fyra fem sex sju åtta nio tio elva tolv hundra tusen miljoner miljon hälften
+mycket mer flera flesta fler olika egen eget egna hel hela rätt fel viktig viktigt viktiga
+svensk svenska sverige stor stora vanlig vanligt vanliga tillsammans också bara endast
+skriva skriver skrev skrivit läsa läser läste läst hända händer hände hänt omkring historia
+börja sluta slutade slutar början slutet period tiden talet sitt egen namn kallade
+""".split())
+
+_WORD = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)*")
+_SUFFIXES = ("arna", "erna", "orna", "ande", "ende", "en", "et", "na", "ar", "er", "or", "de", "te", "s", "a", "t")
+
+
+def load_basic_words(path=os.environ.get("SV_WORD_FREQ"), top=5000):
+    """
+    Use a bigger frequency list if there is one: a text file with one word per
+    line (optionally followed by a count), most frequent first.
+    """
+    if not path or not os.path.exists(path):
+        return BASIC_WORDS
+    words = set(BASIC_WORDS)
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if i >= top:
+                break
+            if line.strip():
+                words.add(line.split()[0].lower())
+    return words
+
+
+basic_words = load_basic_words()
+
+
+def _is_sentence_end(text, end):
+    """
+    True if the punctuation at text[end - 1] ends a sentence.
+    """
+    if text[end - 1] != ".":
+        return True
+    token = text[:end].rsplit(None, 1)[-1].lower()
+    if token in ABBREVIATIONS:
+        return False
+    if re.fullmatch(r"\(?[a-zåäö]\.", token):  # initials like "A. Strindberg"
+        return False
+    if re.fullmatch(r"\d+\.", token) and re.match(r"\s+[a-zåäö]", text[end:]):  # "den 3. maj"
+        return False
+    return True
+
+
+def segment_sentences(text):
+    """
+    Split Swedish text into sentences. Wikipedia headings ("== Rubrik ==")
+    are dropped, every other line is split at ., ! and ? followed by a new
+    sentence, except after common abbreviations and initials.
+    """
+    sentences = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or re.fullmatch(r"=+.*=+", line):
+            continue
+        start = 0
+        for match in re.finditer(r"[.!?]+(?=\s+[\"'”»(]?[A-ZÅÄÖ0-9])", line):
+            end = match.end()
+            if _is_sentence_end(line, end):
+                sentences.append(line[start:end].strip())
+                start = end
+        if line[start:].strip():
+            sentences.append(line[start:].strip())
+    return sentences
+
+
+def _is_basic(word):
+    if word in basic_words:
+        return True
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and word[:-len(suffix)] in basic_words:
+            return True
+    return False
+
+
+def rare_words(sentence):
+    """
+    Words that are not basic vocabulary, leaving out names (capitalised words
+    that don't start the sentence).
+    """
+    words = _WORD.findall(sentence)
+    rare = []
+    for i, word in enumerate(words):
+        if i > 0 and word[0].isupper():
+            continue
+        if len(word) >= 4 and not _is_basic(word.lower()):
+            rare.append(word)
+    return rare
+
+
+def worth_extracting(sentence, min_words=4):
+    """
+    False for noise (too short, mostly numbers or symbols, list fragments) and
+    for sentences with nothing beyond basic vocabulary.
+    """
+    words = _WORD.findall(sentence)
+    if len(words) < min_words:
+        return False
+    letters = sum(ch.isalpha() for ch in sentence)
+    if letters < 0.6 * len(sentence.replace(" ", "")):
+        return False
+    return bool(rare_words(sentence))
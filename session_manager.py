@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class SessionManager:
+    """
+    Hands every Gradio session its own teacher object.
+
+    Sessions are looked up by the session hash of the gr.Request. A session
+    that has been idle for longer than idle_timeout seconds is dropped, and
+    when more than max_sessions are alive the least recently used one goes.
+    factory(session_id, learner) creates the state of a new session and
+    decides what is shared: pass it the process-wide LLM client and caches so
+    only the per-learner state is created per session. learner is the logged
+    in user (demo.launch(auth=...)) or, without a login, the session itself. on_drop(state) is called for
+    every session that ends, dropped or evicted, e.g. to cancel its work.
+    """
+    def __init__(self, factory, max_sessions=50, idle_timeout=30 * 60, on_drop=None):
+        self.factory = factory
+        self.on_drop = on_drop
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()  # session id -> [state, last_seen]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def session_id(request):
+        # Without a request (e.g. called from a script) everything shares one session
+        return getattr(request, "session_hash", None) or "default"
+
+    @classmethod
+    def learner_id(cls, request):
+        # Whose cards and reviews the session works on
+        username = getattr(request, "username", None)
+        return f"user:{username}" if username else cls.session_id(request)
+
+    @staticmethod
+    def anonymous(learner):
+        # A learner_id of a browser session without login: nobody can come
+        # back to it once the session is gone ("default" is shared by scripts)
+        return learner != "default" and not learner.startswith("user:")
+
+    def get(self, request):
+        key = self.session_id(request)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            if key in self._sessions:
+                self._sessions.move_to_end(key)
+                self._sessions[key][1] = now
+                return self._sessions[key][0]
+
+            state = self.factory(key, self.learner_id(request))
+            self._sessions[key] = [state, now]
+            while len(self._sessions) > self.max_sessions:
+                old_key, (old, _) = self._sessions.popitem(last=False)
+                log.info("Session limit reached, dropping session %s", old_key)
+                self._ended(old)
+            return state
+
+    def drop(self, request):
+        with self._lock:
+            entry = self._sessions.pop(self.session_id(request), None)
+        if entry is not None:
+            self._ended(entry[0])
+
+    def _ended(self, state):
+        if self.on_drop is not None:
+            try:
+                self.on_drop(state)
+            except Exception as e:
+                log.warning("Could not close session: %s", e)
+
+    def _evict_idle(self, now):
+        # _sessions is ordered by last use, so idle sessions are at the front
+        while self._sessions:
+            key, (_, last_seen) = next(iter(self._sessions.items()))
+            if now - last_seen < self.idle_timeout:
+                break
+            state, _ = self._sessions.pop(key)
+            self._ended(state)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
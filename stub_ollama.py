@@ -0,0 +1,198 @@
+"""
+A tiny local stand-in for the Ollama HTTP API, enough for ChatOllama and
+OllamaBackend: /api/chat (streaming or not), /api/generate, /api/ps, /api/tags.
+
+    python stub_ollama.py        # two stubs behind an LLMPool, shows how requests are spread
+
+Every reply is the same canned text (or what a reply function returns for the
+request, e.g. canned_reply) after a fixed latency, optionally generated at a
+fixed number of tokens per second.
+"""
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def canned_reply(request):
+    """
+    A plausible reply for every kind of request the app sends, always the same
+    for the same request: vocabulary JSON for extraction (one entry per
+    numbered sentence in chunked mode), feedback (a JSON list of strings when
+    batched), a comma separated list for topics and a question otherwise.
+    """
+    messages = request.get("messages", [])
+    system = messages[0].get("content", "") if messages else ""
+    last = messages[-1].get("content", "") if messages else ""
+
+    def entry(sentence):
+        words = re.findall(r"\w+", sentence) or ["ord"]
+        term = max(words, key=len)
+        return {"term": term, "part_of_speech": "substantiv", "definition": f"betydelsen av {term}",
+                "example": sentence, "extra_note": ""}
+
+    if "format" in request:
+        numbered = re.findall(r"^\[(\d+)\] (.*)$", last, re.M)
+        if numbered:
+            items = [dict(entry(text), sentence=int(i)) for i, text in numbered]
+            for item in items:
+                del item["example"]
+            return json.dumps(items, ensure_ascii=False)
+        return json.dumps([entry(last.split(":", 1)[-1].strip())], ensure_ascii=False)
+    feedback = "Bra skrivet, men tänk på ordföljden efter adverbial."
+    if "JSON list of strings" in system:
+        count = len(re.findall(r"^\d+\. ", last, re.M)) or 1
+        return json.dumps([feedback] * count, ensure_ascii=False)
+    if last.startswith("Please provide feedback"):
+        return feedback
+    if "random topics" in system:
+        return ", ".join(f"Ämne {i}" for i in range(1, 11))
+    return "Intressant! Vad tycker du om hur vikingarna handlade med silver, och varför?"
+
+
+class StubOllama:
+    """
+    Serves canned chat replies on a background thread and counts requests
+    per path, so callers can check where their requests went.
+
+    reply is the text of every reply, or a function of the request JSON that
+    returns it. With tokens_per_second the reply is produced one word (token)
+    at a time at that rate, after latency seconds of "prompt processing".
+    """
+    def __init__(self, reply="[]", latency=0.05, tokens_per_second=None, host="127.0.0.1", port=0):
+        self.reply = reply
+        self.latency = latency  # seconds before the reply starts
+        self.tokens_per_second = tokens_per_second
+        self.requests = {}
+        self.loaded = set()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def _text(self, request):
+        return self.reply(request) if callable(self.reply) else self.reply
+
+    def _chunks(self, text):
+        """
+        The reply as (content, done) pieces, in the shape /api/chat streams them,
+        paced at tokens_per_second.
+        """
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield (word if i == 0 else " " + word), False
+        yield "", True
+
+    def _message(self, model, content, done, started, prompt, reply=""):
+        data = {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": {"role": "assistant", "content": content},
+            "done": done,
+        }
+        if done:
+            data.update({
+                "done_reason": "stop",
+                "total_duration": int((time.perf_counter() - started) * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": max(1, len(prompt) // 4),
+                "eval_count": max(1, len(reply.split(" "))),
+            })
+        return data
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send_json(self, data):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                stub._count(self.path)
+                if self.path == "/api/ps":
+                    self._send_json({"models": [{"name": m, "model": m} for m in sorted(stub.loaded)]})
+                elif self.path == "/api/tags":
+                    self._send_json({"models": [{"name": m, "model": m} for m in sorted(stub.loaded)]})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                stub._count(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                model = request.get("model", "")
+                stub.loaded.add(model)
+                started = time.perf_counter()
+
+                if self.path == "/api/generate":
+                    self._send_json({"model": model, "response": "", "done": True})
+                    return
+                if self.path != "/api/chat":
+                    self.send_error(404)
+                    return
+
+                prompt = "".join(m.get("content", "") for m in request.get("messages", []))
+                reply = stub._text(request)
+                time.sleep(stub.latency)
+                if not request.get("stream", True):
+                    if stub.tokens_per_second:
+                        time.sleep(len(reply.split(" ")) / stub.tokens_per_second)
+                    self._send_json(stub._message(model, reply, True, started, prompt, reply))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for content, done in stub._chunks(reply):
+                    message = stub._message(model, content, done, started, prompt, reply)
+                    line = json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+    from llm_pool import LLMPool, Endpoint
+
+    fast = StubOllama(reply="Hej!", latency=0.05).start()
+    slow = StubOllama(reply="Hej!", latency=0.2).start()
+    pool = LLMPool([Endpoint(fast.url, 2), Endpoint(slow.url, 2)], routes={"extract": "gemma3:1b"})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(8) as workers:
+        replies = list(workers.map(lambda i: pool.for_task("extract").invoke(f"Mening {i}").content, range(40)))
+    print(f"{len(replies)} requests in {time.perf_counter() - started:.2f} s")
+    print("fast endpoint:", fast.requests.get("/api/chat"), "slow endpoint:", slow.requests.get("/api/chat"))
+    print("models loaded:", fast.loaded | slow.loaded)
@@ -0,0 +1,111 @@
+"""
+A tiny local stand-in for the MediaWiki API, enough for wiki_utils:
+action=query (titles, redirects, pageprops) and action=parse (by pageid).
+
+    python stub_wiki.py          # serve a few sample pages and run fetch_wiki_pages against them
+
+Point the bulk fetch at it with WIKI_API_URL=http://127.0.0.1:<port>/w/api.php.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+SAMPLE_PAGES = {
+    "Vikingatiden": "<p>Vikingatiden var en period i nordisk historia.</p><h2>Handel</h2><p>Vikingarna bedrev handel längs floderna.<sup class='reference'>[1]</sup></p>",
+    "Svensk folktro": "<p>Svensk folktro omfattar föreställningar om väsen som näcken och tomten.</p>",
+    "Kvantfysik": "<p>Kvantfysiken beskriver naturen på atomär nivå.</p>",
+    "Merkurius (olika betydelser)": "<p>Merkurius kan syfta på flera saker.</p>",
+}
+SAMPLE_REDIRECTS = {"Vikingar": "Vikingatiden"}
+SAMPLE_DISAMBIGUATION = {"Merkurius (olika betydelser)"}
+
+
+class StubWiki:
+    """
+    Serves pages from memory on a background thread. Counts the requests per
+    action so callers can check how many round trips a fetch took.
+    """
+    def __init__(self, pages=SAMPLE_PAGES, redirects=SAMPLE_REDIRECTS, disambiguation=SAMPLE_DISAMBIGUATION,
+                 host="127.0.0.1", port=0):
+        self.pages = dict(pages)
+        self.redirects = dict(redirects)
+        self.disambiguation = set(disambiguation)
+        self.ids = {title: i for i, title in enumerate(self.pages, start=1)}
+        self.requests = {"query": 0, "parse": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/w/api.php"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def query(self, params):
+        data = {"redirects": [], "pages": []}
+        for title in params.get("titles", "").split("|"):
+            if title in self.redirects:
+                data["redirects"].append({"from": title, "to": self.redirects[title]})
+                title = self.redirects[title]
+            if title not in self.pages:
+                data["pages"].append({"title": title, "missing": True})
+                continue
+            page = {"title": title, "pageid": self.ids[title]}
+            if title in self.disambiguation:
+                page["pageprops"] = {"disambiguation": ""}
+            data["pages"].append(page)
+        return {"query": data}
+
+    def parse(self, params):
+        titles = {i: title for title, i in self.ids.items()}
+        title = titles.get(int(params.get("pageid", 0)))
+        if title is None:
+            return {"error": {"code": "nosuchpageid"}}
+        return {"parse": {"title": title, "pageid": self.ids[title], "text": self.pages[title]}}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                action = params.get("action")
+                if action not in stub.requests:
+                    self.send_error(400, "unsupported action")
+                    return
+                stub.requests[action] += 1
+                body = json.dumps(getattr(stub, action)(params), ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    stub = StubWiki().start()
+    os.environ["WIKI_API_URL"] = stub.url
+    os.environ["WIKI_CACHE"] = os.path.join(tempfile.mkdtemp(), "wiki.sqlite")
+    import wiki_utils
+
+    titles = ["Vikingar", "Svensk folktro", "Kvantfysik", "Merkurius (olika betydelser)", "Finns inte"]
+    for title, page in wiki_utils.fetch_wiki_pages(titles).items():
+        print(f"{title}: {page['content'][:60] if isinstance(page, dict) else page}")
+    print("Requests:", stub.requests)
+    stub.stop()
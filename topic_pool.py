@@ -0,0 +1,90 @@
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+
+
+DEFAULT_PATH = os.environ.get("TOPIC_POOL", os.path.join("cache", "topics.json"))
+log = logging.getLogger(__name__)
+FALLBACK_TOPICS = ["AI i samhället", "Svensk folktro", "Rymdfart", "Kvantfysik", "Vikingatiden"]
+
+
+class TopicPool:
+    """
+    A pool of pre-generated topics so the UI never waits for the LLM.
+
+    choices() hands out topics from the pool straight away (or the fallback
+    list while the pool is still empty). When fewer than low_water topics are
+    left, a background thread asks generate() for more. The pool is saved to
+    disk after every refill and at exit (not on every read), so a restart
+    starts with the topics of the previous run.
+    """
+    def __init__(self, generate, path=DEFAULT_PATH, low_water=20):
+        self.generate = generate
+        self.path = path
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._refilling = False
+        self._dirty = False  # topics handed out since the last save
+        self.topics = self._load()
+        atexit.register(self.save)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return [t for t in json.load(f) if isinstance(t, str)]
+        except (OSError, ValueError):
+            return []
+
+    def save(self):
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _save(self):
+        self._dirty = False
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.topics, f, ensure_ascii=False)
+
+    def choices(self, n=10):
+        """
+        n topics for the dropdown, framed like random_topics().
+        """
+        with self._lock:
+            if self.topics:
+                picked, self.topics = self.topics[:n], self.topics[n:]
+                self._dirty = True
+            else:
+                picked = random.sample(FALLBACK_TOPICS, min(n, len(FALLBACK_TOPICS)))
+        self.refill_async()
+        return ["Välj ett ämne"] + picked + ["Other"]
+
+    def refill_async(self):
+        """
+        Start a background refill if the pool is running low and none is running.
+        """
+        with self._lock:
+            if self._refilling or len(self.topics) >= self.low_water:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, daemon=True).start()
+
+    def _refill(self):
+        try:
+            while len(self.topics) < self.low_water:
+                new = [t for t in self.generate() if t and t not in self.topics]
+                if not new:
+                    break
+                with self._lock:
+                    self.topics.extend(new)
+                    self._save()
+                log.info("Topic pool refilled, %d topics available", len(self.topics))
+        except Exception as e:
+            log.warning("Could not generate topics: %s", e)
+        finally:
+            with self._lock:
+                self._refilling = False
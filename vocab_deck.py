@@ -0,0 +1,217 @@
+"""
+Compact storage for large decks of flashcards.
+
+A VocabDeck keeps the cards column by column instead of one VocabEntry object
+per card: every text field is one packed string plus an array of offsets, and
+part_of_speech is a small code into a table of interned names. Cards are still
+read as c.term, c.definition, ... through light Card views, and a deck
+pickles/deep-copies (gr.State) as a few compressed strings instead of
+thousands of objects.
+"""
+import json
+import struct
+import sys
+import zlib
+from array import array
+from typing import Iterable
+
+from flashcard_extractor import VocabEntry
+
+FIELDS = ("term", "part_of_speech", "definition", "example", "extra_note")
+_COLUMNS = ("terms", "definitions", "examples", "extra_notes")
+
+
+class _Column:
+    """
+    A list of strings stored as one string and the end offset of every item.
+    New items wait in a short tail list and are packed once the tail is as
+    long as the packed part, so appending stays cheap.
+    """
+    __slots__ = ("text", "ends", "tail")
+
+    def __init__(self, items=()):
+        self.text = ""
+        self.ends = array("I")
+        self.tail = list(items)
+        self.pack()
+
+    def pack(self):
+        if self.tail:
+            pos = len(self.text)
+            for item in self.tail:
+                pos += len(item)
+                self.ends.append(pos)
+            self.text += "".join(self.tail)
+            self.tail = []
+
+    def append(self, item):
+        self.tail.append(item)
+        if len(self.tail) >= max(len(self.ends), 64):
+            self.pack()
+
+    def __len__(self):
+        return len(self.ends) + len(self.tail)
+
+    def __getitem__(self, i):
+        packed = len(self.ends)
+        if i >= packed:
+            return self.tail[i - packed]
+        return self.text[self.ends[i - 1] if i else 0:self.ends[i]]
+
+    def __iter__(self):
+        start = 0
+        for end in self.ends:
+            yield self.text[start:end]
+            start = end
+        yield from self.tail
+
+
+class Card:
+    """
+    One card of a deck, read-only. Has the same attributes as VocabEntry.
+    """
+    __slots__ = ("deck", "index")
+
+    def __init__(self, deck, index):
+        self.deck = deck
+        self.index = index
+
+    term = property(lambda self: self.deck.terms[self.index])
+    definition = property(lambda self: self.deck.definitions[self.index])
+    example = property(lambda self: self.deck.examples[self.index])
+    extra_note = property(lambda self: self.deck.extra_notes[self.index])
+    part_of_speech = property(lambda self: self.deck.pos_names[self.deck.pos_codes[self.index]])
+
+    def entry(self) -> VocabEntry:
+        return VocabEntry(*(getattr(self, f) for f in FIELDS))
+
+    def __eq__(self, other):
+        return all(getattr(self, f) == getattr(other, f, None) for f in FIELDS)
+
+    def __repr__(self):
+        return f"Card({self.term!r}, {self.part_of_speech!r})"
+
+
+class VocabDeck:
+    """
+    A list-like deck of flashcards: len(), iteration, deck[i] and deck[a:b]
+    (which gives a new deck), append()/extend() with VocabEntry-like objects.
+    """
+    def __init__(self, entries: Iterable = ()):
+        self.terms = _Column()
+        self.definitions = _Column()
+        self.examples = _Column()
+        self.extra_notes = _Column()
+        self.pos_codes = array("B")  # index into pos_names
+        self.pos_names = []
+        self._pos_index = {}
+        self.extend(entries)
+
+    def _pos_code(self, name):
+        code = self._pos_index.get(name)
+        if code is None:
+            if len(self.pos_names) == 255:
+                # More distinct labels than a byte holds, widen the codes
+                self.pos_codes = array("H", self.pos_codes)
+            code = self._pos_index[name] = len(self.pos_names)
+            self.pos_names.append(sys.intern(name))
+        return code
+
+    def append(self, entry):
+        self.terms.append(entry.term)
+        self.definitions.append(entry.definition)
+        self.examples.append(entry.example)
+        self.extra_notes.append(entry.extra_note)
+        self.pos_codes.append(self._pos_code(entry.part_of_speech))
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+        self.pack()
+
+    def pack(self):
+        for name in _COLUMNS:
+            getattr(self, name).pack()
+
+    def __len__(self):
+        return len(self.pos_codes)
+
+    def __iter__(self):
+        return (Card(self, i) for i in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.select(range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("deck index out of range")
+        return Card(self, index)
+
+    def select(self, indices) -> "VocabDeck":
+        """
+        A new deck with the cards at indices (part of speech codes are kept as they are).
+        """
+        deck = VocabDeck()
+        deck.pos_names, deck._pos_index = list(self.pos_names), dict(self._pos_index)
+        deck.pos_codes = array(self.pos_codes.typecode)
+        for i in indices:
+            for name in _COLUMNS:
+                getattr(deck, name).tail.append(getattr(self, name)[i])
+            deck.pos_codes.append(self.pos_codes[i])
+        deck.pack()
+        return deck
+
+    def without_terms(self, terms) -> "VocabDeck":
+        """
+        A new deck without the cards whose term is in terms (a set).
+        """
+        return self.select([i for i, term in enumerate(self.terms) if term not in terms])
+
+    def entries(self):
+        return [card.entry() for card in self]
+
+    def to_bytes(self) -> bytes:
+        """
+        The deck as one binary blob: the part of speech table and codes, then
+        every column's packed text and offsets, each with a length prefix.
+        """
+        self.pack()
+        parts = [json.dumps(self.pos_names, ensure_ascii=False).encode("utf-8"), self.pos_codes.tobytes()]
+        for name in _COLUMNS:
+            column = getattr(self, name)
+            parts += [column.text.encode("utf-8"), column.ends.tobytes()]
+        header = struct.pack("<c" + "I" * len(parts), self.pos_codes.typecode.encode(), *map(len, parts))
+        return header + b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data) -> "VocabDeck":
+        count = 2 + 2 * len(_COLUMNS)
+        fields = struct.unpack_from("<c" + "I" * count, data)
+        typecode, sizes = fields[0].decode(), fields[1:]
+        pos = struct.calcsize("<c" + "I" * count)
+        parts = []
+        for size in sizes:
+            parts.append(bytes(data[pos:pos + size]))
+            pos += size
+
+        deck = cls()
+        deck.pos_names = [sys.intern(name) for name in json.loads(parts[0])]
+        deck._pos_index = {name: code for code, name in enumerate(deck.pos_names)}
+        deck.pos_codes = array(typecode)
+        deck.pos_codes.frombytes(parts[1])
+        for i, name in enumerate(_COLUMNS):
+            column = getattr(deck, name)
+            column.text = parts[2 + 2 * i].decode("utf-8")
+            column.ends.frombytes(parts[3 + 2 * i])
+        return deck
+
+    # Compact pickling/deep copies (gr.State): the compressed blob instead of card objects
+    def __getstate__(self):
+        return {"data": zlib.compress(self.to_bytes())}
+
+    def __setstate__(self, state):
+        self.__dict__.update(VocabDeck.from_bytes(zlib.decompress(state["data"])).__dict__)
+
+    def __repr__(self):
+        return f"VocabDeck({len(self)} cards)"
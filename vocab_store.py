@@ -0,0 +1,165 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterable, List
+
+from flashcard_extractor import VocabEntry, normalize_term
+
+
+DEFAULT_PATH = os.environ.get("VOCAB_STORE", os.path.join("cache", "vocab.sqlite"))
+MAX_EXAMPLES = 5  # example sentences kept per card
+
+
+class VocabStore:
+    """
+    Persistent vocabulary per learner in SQLite.
+
+    Every card is keyed on (learner, normalized term), so the same term from
+    another sentence, article or session is merged into the existing card:
+    its example sentences are collected instead of creating a duplicate. A
+    FTS5 table over term, definition and examples allows full-text search;
+    prefix lookups use the primary-key index.
+    """
+    def __init__(self, path=DEFAULT_PATH):
+        self._lock = threading.Lock()
+        self._known = {}  # learner -> set of keys, filled on first use
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS cards (
+                learner TEXT NOT NULL,
+                key TEXT NOT NULL,
+                term TEXT NOT NULL,
+                part_of_speech TEXT,
+                definition TEXT,
+                extra_note TEXT,
+                examples TEXT NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (learner, key)
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts USING fts5(
+                learner UNINDEXED, key UNINDEXED, term, definition, examples
+            );
+        """)
+        self._db.commit()
+
+    def _card(self, row) -> VocabEntry:
+        term, pos, definition, extra_note, examples = row
+        return VocabEntry(term, pos, definition, " / ".join(json.loads(examples)), extra_note)
+
+    def add(self, entries: Iterable[VocabEntry], learner="default") -> int:
+        """
+        Add or merge cards. Returns the number of terms that were new.
+        """
+        new = 0
+        now = time.time()
+        with self._lock:
+            known = self._known_keys(learner)
+            for entry in entries:
+                key = normalize_term(entry.term)
+                if not key:
+                    continue
+                row = self._db.execute(
+                    "SELECT rowid, examples FROM cards WHERE learner = ? AND key = ?", (learner, key)
+                ).fetchone()
+                if row is None:
+                    examples = [entry.example]
+                    rowid = self._db.execute(
+                        "INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (learner, key, entry.term, entry.part_of_speech, entry.definition, entry.extra_note,
+                         json.dumps(examples, ensure_ascii=False), now, now),
+                    ).lastrowid
+                    known.add(key)
+                    new += 1
+                else:
+                    rowid, examples = row[0], json.loads(row[1])
+                    if entry.example in examples or len(examples) >= MAX_EXAMPLES:
+                        continue
+                    examples.append(entry.example)
+                    self._db.execute(
+                        "UPDATE cards SET examples = ?, updated = ? WHERE learner = ? AND key = ?",
+                        (json.dumps(examples, ensure_ascii=False), now, learner, key),
+                    )
+                    self._db.execute("DELETE FROM cards_fts WHERE rowid = ?", (rowid,))
+                self._db.execute(
+                    "INSERT INTO cards_fts (rowid, learner, key, term, definition, examples) VALUES (?, ?, ?, ?, ?, ?)",
+                    (rowid, learner, key, entry.term, entry.definition, " ".join(examples)),
+                )
+            self._db.commit()
+        return new
+
+    def _known_keys(self, learner):
+        if learner not in self._known:
+            rows = self._db.execute("SELECT key FROM cards WHERE learner = ?", (learner,))
+            self._known[learner] = {key for (key,) in rows}
+        return self._known[learner]
+
+    def known_terms(self, learner="default") -> set:
+        """
+        Normalized terms the learner already has, for FlashcardExtractor(known_terms=...).
+        """
+        with self._lock:
+            return set(self._known_keys(learner))
+
+    def has(self, term, learner="default") -> bool:
+        with self._lock:
+            return normalize_term(term) in self._known_keys(learner)
+
+    def prefix(self, prefix, learner="default", limit=20) -> List[VocabEntry]:
+        start = normalize_term(prefix)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT term, part_of_speech, definition, extra_note, examples FROM cards "
+                "WHERE learner = ? AND key >= ? AND key < ? ORDER BY key LIMIT ?",
+                (learner, start, start + "\uffff", limit),
+            ).fetchall()
+        return [self._card(r) for r in rows]
+
+    def search(self, query, learner="default", limit=20) -> List[VocabEntry]:
+        """
+        Full-text search over term, definition and example sentences.
+        """
+        words = re.findall(r"\w+", query)
+        if not words:
+            return []
+        match = " ".join(f'"{w}"*' for w in words)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT c.term, c.part_of_speech, c.definition, c.extra_note, c.examples "
+                "FROM cards_fts f JOIN cards c ON c.rowid = f.rowid "
+                "WHERE cards_fts MATCH ? AND f.learner = ? ORDER BY rank LIMIT ?",
+                (match, learner, limit),
+            ).fetchall()
+        return [self._card(r) for r in rows]
+
+    def entries(self, learner="default") -> List[VocabEntry]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT term, part_of_speech, definition, extra_note, examples FROM cards "
+                "WHERE learner = ? ORDER BY created", (learner,)
+            ).fetchall()
+        return [self._card(r) for r in rows]
+
+    def forget(self, learner, delete=False):
+        """
+        Drop the learner's terms from memory (they are loaded again on next
+        use), and with delete=True their cards as well.
+        """
+        with self._lock:
+            self._known.pop(learner, None)
+            if delete:
+                self._db.execute(
+                    "DELETE FROM cards_fts WHERE rowid IN (SELECT rowid FROM cards WHERE learner = ?)", (learner,)
+                )
+                self._db.execute("DELETE FROM cards WHERE learner = ?", (learner,))
+                self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
@@ -0,0 +1,137 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+DEFAULT_PATH = os.environ.get("WIKI_CACHE", os.path.join("cache", "wiki.sqlite"))
+
+SEARCH_TTL = 24 * 3600       # search results change now and then
+PAGE_TTL = 7 * 24 * 3600     # article text hardly changes within a week
+
+
+class WikiCache:
+    """
+    Cache for Wikipedia lookups: a small in-memory LRU in front of a SQLite
+    table. Every entry has its own expiry time; entries imported from a local
+    dump never expire.
+
+    In offline mode nothing is fetched: lookups are answered from the cache
+    (expired entries included) or not at all.
+    """
+    def __init__(self, path=DEFAULT_PATH, max_memory=256, offline=None):
+        self.max_memory = max_memory
+        self.offline = os.environ.get("WIKI_OFFLINE") == "1" if offline is None else offline
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # precompute.py's worker processes share this file: WAL lets them read
+        # while one writes, and a writer waits for the lock instead of failing
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS wiki (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires REAL
+            )""")
+        self._db.commit()
+
+    def _remember(self, key, expires, value):
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+    def get(self, key, allow_expired=False):
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                row = self._db.execute("SELECT value, expires FROM wiki WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    item = (row[1], json.loads(row[0]))
+                    self._remember(key, *item)
+            else:
+                self._memory.move_to_end(key)
+
+            if item is not None and (allow_expired or item[0] is None or item[0] > time.time()):
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, ttl=PAGE_TTL):
+        expires = None if ttl is None else time.time() + ttl
+        with self._lock:
+            self._remember(key, expires, value)
+            self._db.execute(
+                "INSERT OR REPLACE INTO wiki (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires),
+            )
+            self._db.commit()
+
+    def cached(self, key, fetch, ttl=PAGE_TTL):
+        """
+        Return the cached value for key, or call fetch() and cache its result.
+        Returns None on a miss in offline mode.
+        """
+        value = self.get(key, allow_expired=self.offline)
+        if value is not None or self.offline:
+            return value
+        value = fetch()
+        self.put(key, value, ttl)
+        return value
+
+    def titles(self, query, limit=10):
+        """
+        Cached page titles containing query, used for searching while offline.
+        """
+        # % and _ in the query are literal characters, not wildcards
+        pattern = re.sub(r"([\\%_])", r"\\\1", query)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key FROM wiki WHERE key LIKE 'page:%' AND key LIKE ? ESCAPE '\\' LIMIT ?",
+                (f"%{pattern}%", limit),
+            ).fetchall()
+        return [key[len("page:"):] for (key,) in rows]
+
+    def import_dump(self, path):
+        """
+        Import a local article dump: a JSON Lines file with one
+        {"title": ..., "content": ..., "html": ...} object per line.
+        Imported pages never expire. Returns the number of pages imported.
+        """
+        count = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                page = json.loads(line)
+                self.put(f"page:{page['title']}", {"content": page["content"], "html": page.get("html", "")}, ttl=None)
+                count += 1
+        return count
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "in_memory": len(self._memory),
+            "offline": self.offline,
+        }
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python wiki_cache.py artiklar.jsonl  -> import a local dump for offline use
+    for dump in sys.argv[1:]:
+        print(f"Imported {WikiCache().import_dump(dump)} pages from {dump}")
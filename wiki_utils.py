@@ -1,13 +1,50 @@
+import contextvars
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+
+import requests
 import wikipedia
 
+from wiki_cache import WikiCache, SEARCH_TTL, PAGE_TTL
+from metrics import trace
+
+
+wikipedia.set_lang("sv")
+cache = WikiCache()
+log = logging.getLogger(__name__)
 
+MAX_TITLES_PER_QUERY = 50  # MediaWiki limit for titles=A|B|...
+FETCH_WORKERS = 8
+_session = requests.Session()  # keeps connections to the API open between requests
+_session.headers["User-Agent"] = wikipedia.USER_AGENT
+
+
+def api_url():
+    # WIKI_API_URL points the bulk fetch at another server, e.g. stub_wiki.py
+    return os.environ.get("WIKI_API_URL") or wikipedia.API_URL
 
 
 def search_wiki(topic):
-    wikipedia.set_lang("sv")
+    with trace("wiki.search", topic=topic) as span:
+        return _search(topic, span)
+
+
+def _search(topic, span):
+    def search():
+        span["cache_misses"] = 1
+        return wikipedia.search(topic)
+
     try:
-        search_results = wikipedia.search(topic)
-        print(f"Search results for '{topic}': {search_results}")
+        if cache.offline:
+            search_results = cache.get(f"search:{topic}", allow_expired=True) or cache.titles(topic)
+        else:
+            search_results = cache.cached(f"search:{topic}", search, SEARCH_TTL)
+        span["cache_hits"] = 1 - span.get("cache_misses", 0)
+        span["results"] = len(search_results)
+        log.debug("Search results for '%s': %s", topic, search_results)
         return search_results
     except wikipedia.exceptions.DisambiguationError as e:
         search_results = f"⚠️ Ämnet '{topic}' har flera betydelser. Välj ett mer specifikt ämne.\nFörslag: {', '.join(e.options[:5])}"
@@ -16,15 +53,211 @@ def search_wiki(topic):
     return search_results
 
 
+def fetch_wiki_page(title):
+    """
+    Full text and HTML of a page as {"content": ..., "html": ...}, through the cache.
+    Raises the usual wikipedia exceptions, which are never cached.
+    """
+    with trace("wiki.page", title=title) as span:
+        def fetch():
+            span["cache_misses"] = 1
+            html = wikipedia.page(title).html()
+            # Same text as fetch_wiki_pages, both fill the page:<title> entry
+            return {"content": _html_to_text(html), "html": html}
+
+        page = cache.cached(f"page:{title}", fetch, PAGE_TTL)
+        span["cache_hits"] = 1 - span.get("cache_misses", 0)
+        if page is None:  # offline and not in the cache
+            raise wikipedia.exceptions.PageError(None, title)
+        return page
+
+
 def fetch_wiki_article(topic):
-    wikipedia.set_lang("sv")
     try:
-        page = wikipedia.summary(topic, sentences=100)
+        page = cache.cached(f"summary:{topic}", lambda: wikipedia.summary(topic, sentences=100), PAGE_TTL)
+        if page is None:  # offline: fall back to the full text of a cached or imported page
+            page = fetch_wiki_page(topic)["content"]
         return page
     except wikipedia.exceptions.DisambiguationError as e:
         return f"⚠️ Ämnet '{topic}' har flera betydelser. Välj ett mer specifikt ämne.\nFörslag: {', '.join(e.options[:5])}"
     except wikipedia.exceptions.PageError:
         return f"⚠️ Ingen artikel hittades för '{topic}'."
-    
 
 
+class _TextExtractor(HTMLParser):
+    """
+    Turns the parsed article HTML into plain text close to page.content:
+    paragraphs and list items as lines, headings as "== Rubrik ==", and
+    tables, references and edit links left out.
+    """
+    SKIP_TAGS = {"table", "sup", "style", "script", "figure"}
+    SKIP_CLASSES = {"mw-editsection", "reflist", "references", "navbox", "thumb", "toc"}
+    BLOCK_TAGS = {"p", "li", "h2", "h3", "h4", "dd", "dt", "blockquote"}
+    # Elements without a closing tag; skipping one must not wait for its end
+    VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+        self.current = []
+        self.skip_stack = []  # tags we are inside that should be skipped
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip_stack:
+            if tag == self.skip_stack[-1]:
+                self.skip_stack.append(tag)
+            return
+        if tag in self.VOID_TAGS:
+            return
+        classes = set((dict(attrs).get("class") or "").split())
+        if tag in self.SKIP_TAGS or classes & self.SKIP_CLASSES:
+            self.skip_stack.append(tag)
+        elif tag in self.BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if self.skip_stack:
+            if tag == self.skip_stack[-1]:
+                self.skip_stack.pop()
+            return
+        if tag in self.BLOCK_TAGS:
+            heading = "=" * int(tag[1]) if tag in ("h2", "h3", "h4") else ""
+            self._flush(heading)
+
+    def handle_data(self, data):
+        if not self.skip_stack:
+            self.current.append(data)
+
+    def _flush(self, heading=""):
+        text = re.sub(r"\s+", " ", "".join(self.current)).strip()
+        self.current = []
+        if text:
+            self.lines.append(f"\n{heading} {text} {heading}\n" if heading else text)
+
+    def text(self):
+        self._flush()
+        return "\n".join(self.lines).strip()
+
+
+def _html_to_text(html):
+    parser = _TextExtractor()
+    parser.feed(html)
+    return parser.text()
+
+
+def _resolve_titles(titles):
+    """
+    One query request per 50 titles: follows redirects and normalisation and
+    flags missing and disambiguation pages. Returns {requested title: page dict}.
+    """
+    resolved = {}
+    for start in range(0, len(titles), MAX_TITLES_PER_QUERY):
+        batch = titles[start:start + MAX_TITLES_PER_QUERY]
+        data = _session.get(api_url(), params={
+            "action": "query",
+            "format": "json",
+            "formatversion": 2,
+            "redirects": 1,
+            "prop": "pageprops",
+            "ppprop": "disambiguation",
+            "titles": "|".join(batch),
+        }, timeout=10).json()["query"]
+
+        # requested title -> final title, through normalisation and redirects
+        aliases = {}
+        for step in data.get("normalized", []) + data.get("redirects", []):
+            aliases[step["from"]] = step["to"]
+        pages = {p["title"]: p for p in data.get("pages", [])}
+        for title in batch:
+            final = title
+            while final in aliases:
+                final = aliases[final]
+            resolved[title] = pages.get(final, {"title": final, "missing": True})
+    return resolved
+
+
+def _parse_page(page):
+    data = _session.get(api_url(), params={
+        "action": "parse",
+        "format": "json",
+        "formatversion": 2,
+        "pageid": page["pageid"],
+        "prop": "text",
+        "disableeditsection": 1,
+    }, timeout=20).json()
+    html = data["parse"]["text"]
+    return {"content": _html_to_text(html), "html": html}
+
+
+def fetch_wiki_pages(titles):
+    """
+    Text and HTML for several titles at once, e.g. the whole checkbox selection.
+
+    Cached pages are served from the cache. The rest are resolved with one
+    batched query (per 50 titles) and then parsed in parallel, one request per
+    page for both text and HTML. If the batched query fails we fall back to
+    fetch_wiki_page for every title in parallel.
+
+    Returns {title: {"content": ..., "html": ...} or an error message}, in the
+    order of titles.
+    """
+    with trace("wiki.pages", titles=len(titles)) as span:
+        return _fetch_pages(titles, span)
+
+
+def _fetch_pages(titles, span):
+    results = {title: cache.get(f"page:{title}", allow_expired=cache.offline) for title in titles}
+    missing = [t for t, page in results.items() if page is None]
+    span.update(cache_hits=len(titles) - len(missing), cache_misses=len(missing))
+
+    if missing and cache.offline:
+        for title in missing:
+            results[title] = f"⚠️ Ingen artikel hittades för '{title}'."
+    elif missing:
+        try:
+            resolved = _resolve_titles(missing)
+        except Exception as e:
+            log.warning("Batched Wikipedia query failed, fetching one by one: %s", e)
+            pages = _map_in_context(_fetch_or_error, missing)
+            results.update(zip(missing, pages))
+        else:
+            found = []
+            for title, page in resolved.items():
+                if page.get("missing") or page.get("invalid"):
+                    results[title] = f"⚠️ Ingen artikel hittades för '{title}'."
+                elif "disambiguation" in page.get("pageprops", {}):
+                    results[title] = f"⚠️ Ämnet '{title}' har flera betydelser. Välj ett mer specifikt ämne."
+                else:
+                    found.append(title)
+
+            pages = _map_in_context(lambda t: _parse_or_error(t, resolved[t]), found)
+            for title, page in zip(found, pages):
+                results[title] = page
+                if isinstance(page, dict):
+                    cache.put(f"page:{title}", page, PAGE_TTL)
+    return results
+
+
+def _map_in_context(fn, items):
+    # fn over items in worker threads, each in a copy of the caller's context,
+    # so the workers' spans are recorded under the caller's session
+    with ThreadPoolExecutor(FETCH_WORKERS) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+        return [future.result() for future in futures]
+
+
+def _parse_or_error(title, page):
+    try:
+        return _parse_page(page)
+    except Exception as e:
+        log.warning("Error fetching '%s': %s", title, e)
+        return _fetch_or_error(title)
+
+
+def _fetch_or_error(title):
+    try:
+        return fetch_wiki_page(title)
+    except wikipedia.exceptions.DisambiguationError as e:
+        return f"⚠️ Ämnet '{title}' har flera betydelser. Välj ett mer specifikt ämne.\nFörslag: {', '.join(e.options[:5])}"
+    except Exception:
+        return f"⚠️ Ingen artikel hittades för '{title}'."